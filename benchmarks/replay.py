@@ -0,0 +1,43 @@
+"""
+Profile the FS740 driver against a captured session, without the clock.
+
+Record a capture by setting 'record = <file>' for the device in
+devices.ini (or calling FS740.Record(<file>) in a script), then
+
+    python benchmarks/replay.py <file> [cycles] [speed]
+
+replays <cycles> ReadPointsINFLUXDB calls and prints the time per cycle
+and the top of the profile. <speed> reproduces the recorded timing sped
+up by that factor; without it the replay runs as fast as possible.
+"""
+import os
+import sys
+import time
+import cProfile
+import pstats
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from drivers import FS740
+from drivers.transports import ReplaySession, ReplayTransport
+
+def cycle(session, table):
+    with FS740.from_transport(ReplayTransport(session)) as device:
+        return device.ReadPointsINFLUXDB(table)
+
+if __name__ == "__main__":
+    path = sys.argv[1]
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    speed = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    session = ReplaySession(path, speed = speed, strict = False, loop = True)
+    table = 'overview,satellites,log'
+
+    profile = cProfile.Profile()
+    t0 = time.perf_counter()
+    profile.enable()
+    for i in range(cycles):
+        cycle(session, table)
+    profile.disable()
+    dt = time.perf_counter() - t0
+    print('{0} cycles, {1:.3f} ms per cycle'.format(cycles, dt/cycles*1e3))
+    pstats.Stats(profile).sort_stats('cumulative').print_stats(15)
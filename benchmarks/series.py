@@ -0,0 +1,120 @@
+"""
+SeriesStore against plain NumPy files for the local retention of the
+overview fields.
+
+Writes <days> of synthetic 1 Hz timing error and frequency control data
+(instrument resolution, sub-ms timestamp jitter) to a SeriesStore, to one
+.npy file per column and to a compressed .npz, and reports the size on
+disk, the write time, a full read and a one hour range read.
+
+    python benchmarks/series.py [days]
+"""
+import os
+import sys
+import math
+import time
+import random
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from monitoring.series import SeriesStore
+
+FIELDS = ('TBaseTInterval', 'TBaseFControl')
+
+def synthetic(n, t0 = 1.7e9):
+    random.seed(0)
+    times, tint, fcon = [], [], []
+    walk, efc = 0.0, 2.0345
+    for i in range(n):
+        times.append(t0 + i + random.gauss(0, 2e-4))
+        walk += random.gauss(0, 1e-11)
+        # the instrument answers with a few significant digits
+        tint.append(float('{0:.3e}'.format(walk + 2e-9*math.sin(i/600))))
+        if i % 60 == 0:
+            efc = float('{0:.6f}'.format(efc + random.gauss(0, 1e-5)))
+        fcon.append(efc)
+    return times, {"TBaseTInterval":tint, "TBaseFControl":fcon}
+
+def size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def timed(func):
+    t0 = time.perf_counter()
+    result = func()
+    return time.perf_counter() - t0, result
+
+def measure(path, write, read, read_range):
+    write_time = timed(write)[0]
+    return size(path), write_time, timed(read)[0], timed(read_range)[0]
+
+def bench_store(root, times, values, start, end):
+    path = os.path.join(root, 'store')
+    def write():
+        store = SeriesStore(path, FIELDS)
+        for i, t in enumerate(times):
+            store.append(t, {field: values[field][i] for field in FIELDS})
+        store.close()
+    return measure(path, write, lambda: SeriesStore(path, FIELDS).read(),
+                   lambda: SeriesStore(path, FIELDS).read(start, end))
+
+def bench_npy(root, times, values, start, end):
+    path = os.path.join(root, 'npy')
+    os.makedirs(path)
+    def write():
+        np.save(os.path.join(path, 'time.npy'), np.array(times))
+        for field in FIELDS:
+            np.save(os.path.join(path, field + '.npy'), np.array(values[field]))
+    def read():
+        return [np.load(os.path.join(path, name + '.npy'))
+                for name in ('time',) + FIELDS]
+    def read_range():
+        t = np.load(os.path.join(path, 'time.npy'), mmap_mode = 'r')
+        i, j = np.searchsorted(t, (start, end))
+        return [np.array(np.load(os.path.join(path, name + '.npy'),
+                                 mmap_mode = 'r')[i:j])
+                for name in ('time',) + FIELDS]
+    return measure(path, write, read, read_range)
+
+def bench_npz(root, times, values, start, end):
+    path = os.path.join(root, 'series.npz')
+    def write():
+        np.savez_compressed(path, time = np.array(times),
+            **dict((field, np.array(values[field])) for field in FIELDS))
+    def read():
+        with np.load(path) as f:
+            return [f[name] for name in ('time',) + FIELDS]
+    def read_range():
+        # the whole archive has to be decompressed
+        t, *columns = read()
+        i, j = np.searchsorted(t, (start, end))
+        return [t[i:j]] + [c[i:j] for c in columns]
+    return measure(path, write, read, read_range)
+
+if __name__ == "__main__":
+    days = float(sys.argv[1]) if len(sys.argv) > 1 else 7
+    n = int(days*86400)
+    times, values = synthetic(n)
+    start = times[n//2]
+    end = start + 3600
+    root = tempfile.mkdtemp()
+    try:
+        print('{0} samples of {1} fields, {2:.1f} MB raw'.format(
+              n, len(FIELDS), 8*(1 + len(FIELDS))*n/1e6))
+        print('{0:12} {1:>10} {2:>8} {3:>10} {4:>10} {5:>12}'.format(
+              'format', 'size [MB]', 'B/sample', 'write [s]', 'read [s]',
+              '1 h read [ms]'))
+        for name, bench in (('SeriesStore', bench_store), ('npy', bench_npy),
+                            ('npz', bench_npz)):
+            nbytes, write, read, read_range = bench(root, times, values,
+                                                    start, end)
+            print('{0:12} {1:10.2f} {2:8.2f} {3:10.2f} {4:10.2f} {5:12.2f}'
+                  .format(name, nbytes/1e6, nbytes/n, write, read,
+                          read_range*1e3))
+    finally:
+        shutil.rmtree(root)
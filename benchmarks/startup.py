@@ -0,0 +1,56 @@
+"""
+Cold start benchmark for the recorder GUI.
+
+Imports main.py and reads the device configuration in a fresh interpreter
+<n> times and reports the median wall time, followed by the slowest
+imports of the last run as reported by python -X importtime.
+
+    python benchmarks/startup.py [n]
+"""
+import os
+import sys
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import time
+t0 = time.perf_counter()
+import configparser
+import main
+devices = configparser.ConfigParser()
+devices.read("config/devices.ini")
+for d in devices.sections():
+    main.driver_args(getattr(main.drivers, devices[d]["driver"]))
+print(time.perf_counter() - t0)
+"""
+
+def run(n):
+    times = []
+    for i in range(n):
+        out = subprocess.run([sys.executable, '-c', SNIPPET], cwd = ROOT,
+                             capture_output = True, text = True, check = True)
+        times.append(float(out.stdout))
+    return times
+
+def slowest_imports(count = 10):
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', SNIPPET],
+                         cwd = ROOT, capture_output = True, text = True,
+                         check = True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse = True)[:count]
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    times = run(n)
+    print('startup: median {0:.1f} ms, min {1:.1f} ms over {2} runs'.format(
+          statistics.median(times)*1e3, min(times)*1e3, n))
+    print('slowest imports (cumulative):')
+    for cumulative, name in slowest_imports():
+        print('{0:8.1f} ms  {1}'.format(cumulative/1e3, name))
@@ -1,20 +1,163 @@
-import visa
+import sys
+import time
+import functools
+import contextlib
 import datetime as dt
+from collections import OrderedDict
+
+from .plan import Field, QueryPlan, ResponseError, parsing
+from .broker import DeviceBroker
+from .transports import SocketTransport, RecordingTransport, \
+                        ReplaySession, ReplayTransport
+
+def _bit_names(bits, width = 32):
+    """
+    Expand a sparse (bit, name) table into a list indexed by bit number,
+    naming undocumented bits BitN so that no set bit is lost.
+    """
+    names = ['Bit{0}'.format(i) for i in range(width)]
+    for bit, name in bits:
+        names[bit] = name
+    return names
+
+def _flag(response):
+    return response.strip() not in ('0', 'OFF')
+
+def _item(index, conv):
+    """
+    Parser for element <index> of a comma separated response.
+    """
+    return lambda response: conv(response.split(',')[index])
+
+@functools.lru_cache(maxsize = 4)
+def _satellites(response):
+    """
+    (id, signal, elevation, azimuth) of the tracked, current satellites in
+    a GPS:SAT:TRAC:STAT? response, 8 values per receiver channel.
+    """
+    val = response.split(',')
+    return tuple((int(val[i]), int(val[i+4]), int(val[i+5]), int(val[i+6]))
+                 for i in range(0, len(val) - 7, 8)
+                 if (val[i+3] == '0') and (val[i] != '0'))
+
+# queries with side effects, which are neither repeated nor shared: those
+# ending in a mnemonic that reads and clears an event register or pops a
+# queue, and those containing a measurement mnemonic
+CLEARING = ('EVEN', 'ERR', 'REM')
+MEASURING = ('READ', 'MEAS', 'FETC', 'INIT', '*ESR', '*OPC')
+
+def read_only(cmd):
+    """
+    True if <cmd> only contains queries without side effects.
+    """
+    for part in cmd.upper().split(';'):
+        header = part.strip().lstrip(':').split(' ')[0]
+        if not header:
+            continue
+        if not header.endswith('?'):
+            return False
+        tokens = [token.rstrip('0123456789')
+                  for token in header.rstrip('?').split(':')]
+        if tokens[-1].startswith(CLEARING) or \
+           any(token.startswith(MEASURING) for token in tokens):
+            return False
+    return True
+
+def _io_errors():
+    """
+    Exceptions of a failed exchange that are worth retrying: timeouts and
+    lost connections, garbled or truncated responses that fail to parse,
+    and pyvisa I/O errors if visa is in use.
+    """
+    errors = (OSError, ResponseError)
+    pyvisa = sys.modules.get('pyvisa')
+    if pyvisa is not None:
+        errors += (pyvisa.errors.VisaIOError,)
+    return errors
+
+def _header(cmd):
+    """
+    Header of a command or query as a tuple of mnemonics cut to three
+    characters (four for common commands), so that the short and long
+    forms used by setters and queries compare equal, e.g. 'SYST:DATE 1'
+    and 'SYST:DAT?'.
+    """
+    head = cmd.strip().lstrip(':').split(' ')[0].rstrip('?').upper()
+    return tuple(m[:3 + m.startswith('*')] for m in head.split(':'))
+
+def _snr(response):
+    sats = _satellites(response)
+    return round(sum(s[1] for s in sats)/len(sats), 1) if sats else 0.0
 
 class FS740:
-    def __init__(self, resource_manager, resource_name, protocol = 'RS232'):
+    # protocols that need a visa resource manager, TCP uses a plain socket
+    # and takes 'host' or 'host:port' as resource_name, REPLAY plays back a
+    # session captured with Record() from the file resource_name
+    VISA_PROTOCOLS = ('RS232', 'VISA-TCP')
+
+    def __init__(self, resource_manager, resource_name, protocol = 'RS232',
+                 timeout = 2.0):
         self.rm = resource_manager
         if protocol == 'RS232':
+            import visa
             self.instr = self.rm.open_resource(resource_name)
             self.instr.parity = visa.constants.Parity.none
             self.instr.data_bits = 8
             self.instr.write_termination = '\r\n'
             self.instr.read_termination = '\r\n'
             self.instr.baud_rate = 115200
+            self.instr.timeout = float(timeout)*1e3
         elif protocol == 'TCP':
+            host, port = SocketTransport.parse_address(resource_name)
+            self.instr = SocketTransport(host, port, float(timeout))
+        elif protocol == 'VISA-TCP':
             self.instr = self.rm.open_resource("TCPIP::{0}::5025::SOCKET".format(resource_name))
             self.instr.write_termination = '\r\n'
             self.instr.read_termination = '\r\n'
+            self.instr.timeout = float(timeout)*1e3
+        elif protocol == 'REPLAY':
+            self.instr = ReplayTransport(ReplaySession.open(resource_name))
+        else:
+            raise ValueError('protocol invalid value')
+
+    @classmethod
+    def from_transport(cls, instr):
+        """
+        Create a driver on an already opened transport, e.g. a
+        ReplayTransport with non-default replay settings.
+        """
+        self = cls.__new__(cls)
+        self.rm = None
+        self.instr = instr
+        return self
+
+    @classmethod
+    def Shared(cls, resource_manager, resource_name, protocol = 'RS232',
+               timeout = 2.0, client = 'script', priority = 10):
+        """
+        Driver on the session of a DeviceBroker that is shared by all
+        Shared() drivers for <resource_name> in this process, opening the
+        session on first use. <client> names the caller in the broker
+        statistics; commands with a lower <priority> are served first.
+        """
+        broker = DeviceBroker.shared(resource_name,
+            lambda: cls(resource_manager, resource_name, protocol, timeout).instr)
+        return cls.from_transport(broker.client(client, priority))
+
+    def Record(self, path):
+        """
+        Append all further commands and responses of this session to the
+        capture file <path>, for replay with protocol = 'REPLAY'.
+        """
+        self.instr = RecordingTransport(self.instr, path)
+
+    def AbortSession(self):
+        """
+        Called from another thread to end a session that is stuck in I/O.
+        The blocked call raises and the session has to be reopened. The
+        broker of a Shared() session reopens it for the next command.
+        """
+        getattr(self.instr, 'abort', self.instr.close)()
 
     def __enter__(self):
         return self
@@ -22,127 +165,388 @@ class FS740:
     def __exit__(self, *exc):
         self.instr.close()
 
+    # a failed exchange is repeated up to <retries> times, after resyncing
+    # and waiting backoff, 2*backoff, ... seconds, at most max_backoff
+    retries = 2
+    backoff = 0.1
+    max_backoff = 2.0
+    # failed exchanges of this session, retried or not
+    failures = 0
+
+    def retry(self, func, *args):
+        """
+        Call func(*args), retrying after I/O errors and garbled responses.
+        Only for exchanges that can be repeated, see read_only.
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return func(*args)
+            except _io_errors():
+                self.failures += 1
+                if attempt == self.retries:
+                    raise
+            time.sleep(min(self.backoff*2**attempt, self.max_backoff))
+            try:
+                self.resync()
+            except _io_errors():
+                pass
+
+    def resync(self):
+        """
+        Discard pending input and read until the reply to *OPC? comes
+        back, so that a late reply to a failed query is not taken as the
+        answer to the next one.
+        """
+        if hasattr(self.instr, 'clear'):
+            self.instr.clear()
+        response = self.instr.query('*OPC?')
+        for _ in range(3):
+            if response.strip() == '1':
+                return
+            response = self.instr.read()
+        raise ResponseError('no reply to *OPC? while resyncing')
+
+    # queries of settings that EnableCache() memoizes, by header prefix,
+    # with their time to live in seconds, None for until invalidated
+    CACHE_TTL = OrderedDict([
+        ('*IDN', None), ('*OPT', None), ('*PSC', None), ('*ESE', 60.0),
+        ('*SRE', 60.0), ('SYST:COMM', 300.0), ('SYST:DISP', 60.0),
+        ('SYST:ALAR:MODE', 60.0), ('SYST:ALAR:ENAB', 60.0),
+        ('GPS:CONF', 60.0), ('TBAS:CONF', 60.0), ('SOUR', 60.0),
+        ('CALC:FILT', 60.0), ('SENS', 60.0), ('INP', 60.0),
+    ])
+    # setters after which no cached setting can be trusted
+    CACHE_RESET = ('*RST', '*RCL', 'SYST:SEC:IMM', 'SYST:COMM:LAN:RES')
+    cache = None
+
+    def EnableCache(self, ttls = None):
+        """
+        Memoize the responses to queries of settings (CACHE_TTL, updated
+        with <ttls>) on this object. A setter sent through the same object
+        invalidates the cached queries of its subsystem, e.g.
+        GPSConfigQuality all GPS:CONF queries, and *RST, *RCL and
+        SYST:SEC:IMM the whole cache.
+        """
+        ttl = OrderedDict(self.CACHE_TTL)
+        ttl.update(ttls or {})
+        self.cache_ttl = [(_header(h), t) for h, t in ttl.items()]
+        # longest prefix first
+        self.cache_ttl.sort(key = lambda item: -len(item[0]))
+        self.cache_reset = [_header(h) for h in self.CACHE_RESET]
+        self.cache = {}
+        self.cache_stats = {"hits":0, "misses":0, "invalidations":0}
+
+    def CacheTTL(self, cmd):
+        """
+        Time to live of the response to <cmd>, False if it is not cached.
+        A compound query is cached only if all of its parts are, for the
+        shortest of their times.
+        """
+        ttls = []
+        for part in cmd.split(';'):
+            header = _header(part)
+            for prefix, ttl in self.cache_ttl:
+                if header[:len(prefix)] == prefix:
+                    ttls.append(float('inf') if ttl is None else ttl)
+                    break
+            else:
+                return False
+        return min(ttls)
+
+    def CacheStats(self):
+        stats = dict(self.cache_stats) if self.cache is not None else \
+                {"hits":0, "misses":0, "invalidations":0}
+        lookups = stats["hits"] + stats["misses"]
+        stats["entries"] = len(self.cache or ())
+        stats["hit_rate"] = stats["hits"]/lookups if lookups else 0.0
+        return stats
+
+    def Invalidate(self, cmd):
+        """
+        Drop the cached responses a setter <cmd> may have changed.
+        """
+        for part in cmd.split(';'):
+            header = _header(part)
+            if any(header[:len(h)] == h for h in self.cache_reset):
+                self.cache_stats["invalidations"] += len(self.cache)
+                self.cache.clear()
+                return
+            subsystem = header[:-1] or header
+            stale = [c for c in self.cache
+                     if any(_header(p)[:len(subsystem)] == subsystem
+                            for p in c.split(';'))]
+            for c in stale:
+                del self.cache[c]
+            self.cache_stats["invalidations"] += len(stale)
+
+    # span tracer, e.g. monitoring.trace.tracer, None for no tracing
+    tracer = None
+
+    def Span(self, name, **args):
+        """
+        Span of the tracer around an exchange with the instrument, a no-op
+        without a tracer.
+        """
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(name, 'FS740', **args)
+
     def query(self, cmd):
-        return self.instr.query(cmd)
+        with self.Span('query', cmd = cmd):
+            if not read_only(cmd):
+                # a repeat would lose what the first reply cleared
+                return self.instr.query(cmd)
+            if self.cache is None:
+                return self.retry(self.instr.query, cmd)
+            ttl = self.CacheTTL(cmd)
+            if ttl is False:
+                return self.retry(self.instr.query, cmd)
+            now = time.monotonic()
+            entry = self.cache.get(cmd)
+            if entry is not None and now < entry[1]:
+                self.cache_stats["hits"] += 1
+                return entry[0]
+            self.cache_stats["misses"] += 1
+            response = self.retry(self.instr.query, cmd)
+            self.cache[cmd] = (response, now + ttl)
+            return response
 
     def set(self, cmd):
-        self.instr.write(cmd)
+        with self.Span('set', cmd = cmd):
+            self.instr.write(cmd)
+        if self.cache is not None:
+            self.Invalidate(cmd)
+
+    def write(self, cmd):
+        self.set(cmd)
+
+    def query_many(self, cmds):
+        """
+        Query a list of commands and return the responses in order. Over a
+        transport that supports pipelining all queries are sent before the
+        first response is read, hiding the round trip time. Not retried,
+        callers retry the whole batch.
+        """
+        # (sent, received) host times of each command, for sample_times
+        self.timings = []
+        responses = []
+        with self.Span('query_many', cmds = list(cmds)):
+            if hasattr(self.instr, 'submit'):
+                replies = []
+                for cmd in cmds:
+                    replies.append((time.time(), self.instr.submit(cmd)))
+                for sent, reply in replies:
+                    responses.append(reply.result())
+                    self.timings.append((sent, time.time()))
+                return responses
+            for cmd in cmds:
+                t0 = time.time()
+                responses.append(self.instr.query(cmd))
+                self.timings.append((t0, time.time()))
+            return responses
+
+    # fields of ReadValue, in order
+    VALUE_FIELDS = ('SystemDate', 'SystemTime', 'GPSAlignment', 'TBaseState',
+                    'TBaseHoldDuration', 'TBaseWarmDuration',
+                    'TBaseLockDuration', 'TBaseFControl', 'TBaseHMode',
+                    'TBaseBWidth', 'TBaseLock', 'TBaseTIntervalLimit',
+                    'TBaseTInterval', 'TBaseTIntervalAverage',
+                    'TBaseTConstantCurrent', 'TBaseTConstantTarget',
+                    'GPSPosition', 'GPSMode', 'GPSQuality', 'GPSADelay',
+                    'GPSSatelliteTracking', 'GPSSatelliteTrackingStatus')
 
     def ReadValue(self, full_output = False):
-        date = self.ReadSystemDate()
-        time =  self.ReadSystemTime()
-        time_alig = self.ReadGPSConfigAlignment()
-        tbase_state = self.TBaseState()
-        tbase_hold_dur = int(self.TBaseStateHoldoverDuration())
-        tbase_warm_dur = int(self.TBaseStateWarumpDuration())
-        tbase_lock_dur = int(self.TBaseStateLockDuration())
-        fcontrol = float(self.ReadTBaseFControl())
-        hmode = self.ReadTBaseConfigHMode()
-        bwidth = self.ReadTBaseConfigBWidth()
-        lock = bool(self.ReadTBaseConfigLock())
-        tint_lim = float(self.ReadTBaseConfigTIntervalLimit())
-        tint = float(self.TBaseTInterval())
-        tint_avg = float(self.TBaseTInterval(average = True))
-        tconstant_cur = int(self.ReadTBaseTConstant())
-        tconstant_tar = int(self.ReadTBaseTConstant("TARG"))
-        gps_pos = self.GPSPosition()
-        gps_track = self.GPSSatelliteTracking()
-        gps_track_state = self.GPSSatelliteTrackingStatus()
-        gps_mode = self.ReadGPSConfigMode()
-        gps_qual = self.ReadGPSConfigQuality()
-        gps_adelay = float(self.ReadGPSConfigADelay())
-        values = (date, time, time_alig, tbase_state, tbase_hold_dur,
-                  tbase_warm_dur, tbase_lock_dur, fcontrol, hmode, bwidth, lock,
-                  tint_lim, tint, tint_avg, tconstant_cur, tconstant_tar, gps_pos,
-                  gps_mode, gps_qual, gps_adelay, gps_track, gps_track_state)
-        desc = ('SystemDate', 'SystemTime', 'GPSAlignment', 'TBaseState',
-                'TBaseHoldDuration', 'TBaseWarmDuration', 'TBaseLockDuration',
-                'TBaseFControl', 'TBaseHMode', 'TBaseBWidth', 'TBaseLock',
-                'TBaseTIntervalLimit', 'TBaseTInterval', 'TBaseTIntervalAverage',
-                'TBaseTConstantCurrent', 'TBaseTConstantTarget', 'GPSPosition',
-                'GPSMode', 'GPSQuality', 'GPSADelay', 'GPSSatelliteTracking',
-                'GPSSatelliteTrackingStatus')
+        """
+        Read the VALUE_FIELDS into a snapshot record, a namedtuple whose
+        fields are parsed once and can be addressed by name or position,
+        e.g. record.TBaseFControl or record[7]. With <full_output> the
+        field names are returned as well, as (record, names).
+        """
+        record, timestamp = self.retry(self.ReadPlan, self.Plan(self.VALUE_FIELDS))
         if full_output:
-            return values, desc
+            return record, record._fields
         else:
-            return values
-
-    @staticmethod
-    def ExpandValue(values, desc, label, conv, labels):
-        idx = desc.index(label)
-        val = values[idx].split(',')
-        val = [c(v) for c,v in zip(conv,val)]
-        values = list(values)
-        del values[idx]
-        values[idx:idx] = val
-        desc = list(desc)
-        del desc[idx]
-        desc[idx:idx] = labels
-        return values, desc
-
-    @staticmethod
-    def chunks(l,n):
-        lst = []
-        for i in range(0, len(l), n):
-            lst.append(l[i:i+n])
-        return lst
+            return record
 
     def WriteValueINFLUXDB(self, connection, table):
+        points = self.ReadPointsINFLUXDB(table)
+        with self.Span('write_points', points = len(points)):
+            connection.write_points(points)
+
+    # field name -> query, parser and group, in the order of the overview
+    # point
+    FIELDS = OrderedDict([
+        ('SystemDate', Field('SYST:DAT?', str, 'time')),
+        ('SystemTime', Field('SYST:TIM?', str, 'time')),
+        ('GPSAlignment', Field('GPS:CONF:ALIG?', str, 'overview')),
+        ('TBaseState', Field('TBAS?', str, 'overview')),
+        ('TBaseHoldDuration', Field('TBAS:STAT:HOLD:DUR?', int, 'overview')),
+        ('TBaseWarmDuration', Field('TBAS:WARM?', int, 'overview')),
+        ('TBaseLockDuration', Field('TBAS:STAT:LOCK:DUR?', int, 'overview')),
+        ('TBaseFControl', Field('TBAS:FCON?', float, 'overview')),
+        ('TBaseHMode', Field('TBAS:CONF:HMOD?', str, 'overview')),
+        ('TBaseBWidth', Field('TBAS:CONF:BWID?', str, 'overview')),
+        ('TBaseLock', Field('TBAS:CONF:LOCK?', _flag, 'overview')),
+        ('TBaseTIntervalLimit', Field('TBAS:CONF:TINT:LIM?', float, 'overview')),
+        ('TBaseTInterval', Field('TBAS:TINT? CURR', float, 'overview')),
+        ('TBaseTIntervalAverage', Field('TBAS:TINT? AVER', float, 'overview')),
+        ('TBaseTConstantCurrent', Field('TBAS:TCON? CURR', int, 'overview')),
+        ('TBaseTConstantTarget', Field('TBAS:TCON? TARG', int, 'overview')),
+        ('latitude', Field('GPS:POS?', _item(0, float), 'overview')),
+        ('longitude', Field('GPS:POS?', _item(1, float), 'overview')),
+        ('altitude', Field('GPS:POS?', _item(2, float), 'overview')),
+        ('antiJamming', Field('GPS:CONF:MOD?', _item(0, _flag), 'overview')),
+        ('elevationMask', Field('GPS:CONF:MOD?', _item(1, float), 'overview')),
+        ('signalMask', Field('GPS:CONF:MOD?', _item(2, float), 'overview')),
+        ('GPSQuality', Field('GPS:CONF:QUAL?', str, 'overview')),
+        ('GPSADelay', Field('GPS:CONF:ADEL?', float, 'overview')),
+        ('satelitesConnected', Field('GPS:SAT:TRAC:STAT?',
+            lambda r: len(_satellites(r)), 'overview')),
+        ('SNR', Field('GPS:SAT:TRAC:STAT?', _snr, 'overview')),
+        ('GPSSatellites', Field('GPS:SAT:TRAC:STAT?', _satellites, 'satellites')),
+        # unparsed responses, for ReadValue
+        ('GPSPosition', Field('GPS:POS?', str, 'raw')),
+        ('GPSMode', Field('GPS:CONF:MOD?', str, 'raw')),
+        ('GPSSatelliteTracking', Field('GPS:SAT:TRAC?', str, 'raw')),
+        ('GPSSatelliteTrackingStatus', Field('GPS:SAT:TRAC:STAT?', str, 'raw')),
+    ])
+    DEFAULT_FIELDS = ('overview', 'satellites')
+    TIMING_FIELDS = ('TBaseState', 'TBaseTInterval', 'TBaseTIntervalAverage',
+                     'TBaseFControl')
+    # conservative command and response sizes for compound commands
+    MAX_COMMAND = 256
+    MAX_RESPONSE = 1024
+    RESPONSE_SIZE = {'GPS:SAT:TRAC:STAT?':640, 'GPS:POS?':60,
+                     'GPS:CONF:MOD?':30}
+
+    @classmethod
+    @functools.lru_cache(maxsize = None)
+    def Plan(cls, fields = DEFAULT_FIELDS):
+        """
+        Compiled QueryPlan for a tuple of field names and/or groups of
+        FIELDS; the date and time are always included.
+        """
+        return QueryPlan(cls.FIELDS, fields, max_command = cls.MAX_COMMAND,
+                         max_response = cls.MAX_RESPONSE,
+                         response_size = cls.RESPONSE_SIZE)
+
+    def ReadPointsINFLUXDB(self, table, fields = DEFAULT_FIELDS, events = True):
+        """
+        Read <fields> (names and/or groups of FIELDS) with the minimal set
+        of compound commands and return them as a list of InfluxDB points
+        for the overview, satellites and log tables. With <events> the
+        timebase event queue is drained into the log table.
+        """
         tableO, tableS, tableL = table.split(',')
-        values, descs = self.ReadValue(full_output = True)
-
-        s = values[1].split('.')
-        time = dt.datetime.strptime(values[0]+' '+s[0]+'.'+s[1][:6],
-                                    '%Y,%m,%d %H,%M,%S.%f').isoformat()
-
-        values, descs = self.ExpandValue(values, descs, 'GPSMode',
-                                         (bool, float, float), ('antiJamming',
-                                         'elevationMask','signalMask'))
-        values, descs = self.ExpandValue(values, descs, 'GPSPosition',
-                                         (float, float, float),
-                                         ('latitude', 'longitude', 'altitude'))
-
-        idx = descs.index('GPSSatelliteTrackingStatus')
-        sats = self.chunks(values[idx].split(','), 8)
-        ids, signal, elevation, azimuth = \
-        zip(*[(int(val[0]), int(val[4]), int(val[5]), int(val[6]))
-              for val in sats if (val[3] =='0') and (val[0] != '0')])
-
-        values = values[2:-2]
-        descs = descs[2:-2]
-        values.append(len(ids))
-        descs.append("satelitesConnected")
-        values.append(round(sum(signal)/len(signal),1))
-        descs.append('SNR')
-
-        writeO = {"measurement":tableO,
-                 "tags": {'clock_id':'FS740'},
-                 "time":time,
-                 "fields":dict((key,value) for key,value in
-                               zip(descs,values))}
-
-        writeS = [{"measurement":tableS,
-                  "tags":{'satelliteID':id},
-                  "time":time,
-                  "fields":{"signal":sig,
-                            "elevation":ele,
-                            "azimuth":azi}} for id, sig, ele, azi in \
-                  zip(ids, signal, elevation, azimuth)]
-
-        writeL = []
-        while int(self.TBaseEventCount()) > 0:
-            event = self.TBaseEventNext().split(',')
+        plan = self.Plan(tuple(fields))
+        record, timestamp = self.retry(self.ReadPlan, plan)
+
+        # each point is stamped at the time its fields were sampled
+        points = []
+        overview = plan.group(record, 'overview')
+        if overview:
+            points.append({"measurement":tableO,
+                           "tags": {'clock_id':'FS740'},
+                           "time":self.FieldTime(timestamp, overview),
+                           "fields":overview})
+
+        if 'GPSSatellites' in plan.fields:
+            time_sats = self.FieldTime(timestamp, ['GPSSatellites'])
+            points += [{"measurement":tableS,
+                        "tags":{'satelliteID':id},
+                        "time":time_sats,
+                        "fields":{"signal":sig,
+                                  "elevation":ele,
+                                  "azimuth":azi}}
+                       for id, sig, ele, azi in record.GPSSatellites]
+
+        for event in (self.TBaseEventDrain() if events else ()):
+            event = event.split(',')
             msg = event[0]
             ts = ','.join(event[1:])
             ts = dt.datetime.strptime(ts,"%Y,%m,%d,%H,%M,%S").isoformat()
-            writeL.append({"measurement":tableL,
+            points.append({"measurement":tableL,
                            "tags":{"deviceID":'FS740', "label":"event"},
                            "time":ts, "fields":{"message":msg}})
 
-        connection.write_points([writeO])
-        connection.write_points(writeS)
-        if len(writeL) > 0:
-            connection.write_points(writeL)
+        return points
+
+    def ReadPlan(self, plan):
+        """
+        Execute <plan> and parse its timestamp, raising on a garbled or
+        truncated response.
+        """
+        responses = self.query_many(plan.commands)
+        with self.Span('parse', fields = len(plan.fields)):
+            record = plan.parse(responses)
+            # seconds from the SYST:TIM? sample to the sample of each field
+            t = plan.sample_times(self.timings)
+            t0 = t[plan.queries.index(self.FIELDS['SystemTime'].query)]
+            self.field_delays = dict((name, t[i] - t0) for name, (_, i)
+                                     in zip(plan.fields, plan.getters))
+            with parsing('parsing the timestamp'):
+                return record, self.ParseTimestamp(record.SystemDate,
+                                                   record.SystemTime)
+
+    def FieldTime(self, timestamp, names):
+        """
+        The ISO <timestamp> of the SYST:TIM? sample of the last read
+        moved to the mean sample time of the fields <names>, compensating
+        for the time taken by the queries in between.
+        """
+        delays = [self.field_delays[name] for name in names]
+        if not delays:
+            return timestamp
+        return (dt.datetime.fromisoformat(timestamp) +
+                dt.timedelta(seconds = sum(delays)/len(delays))).isoformat()
+
+    def ReadTimingPointsINFLUXDB(self, table):
+        """
+        Read only the timebase state, timing error and frequency control,
+        for fast polling in between full reads. Returns a one point list
+        for the overview table.
+        """
+        return self.ReadPointsINFLUXDB(table, self.TIMING_FIELDS, events = False)
+
+    def ReadStatisticsPointsINFLUXDB(self, table, count, front = True):
+        """
+        The summary of a completed statistics block (see
+        ReadStatisticsBlock) as a one point list for <table>, empty while
+        the block is still running.
+        """
+        block = self.ReadStatisticsBlock(count, front)
+        if block is None:
+            return []
+        timestamp, fields = block
+        return [{"measurement":table,
+                 "tags":{'clock_id':'FS740', 'input':'front' if front else 'rear'},
+                 "time":timestamp, "fields":fields}]
+
+    @staticmethod
+    def ParseTimestamp(date, tod):
+        """
+        Convert the SYST:DAT? and SYST:TIM? responses into an ISO format
+        timestamp with microsecond resolution.
+        """
+        s = tod.split('.')
+        return dt.datetime.strptime(date+' '+s[0]+'.'+s[1][:6],
+                                    '%Y,%m,%d %H,%M,%S.%f').isoformat()
+
+    def ReadClockOffset(self):
+        """
+        Offset of the host clock from the FS740 clock, NTP style: the date
+        and time are queried on their own and the time, evaluated just
+        before the reply is sent, is taken to be sampled halfway through
+        the round trip. Returns (offset, round trip delay, host time), the
+        offset positive when the host clock is ahead, in seconds and
+        seconds since the epoch. The FS740 time is read as UTC.
+        """
+        t1 = time.time()
+        date, tod = self.query('SYST:DAT?;:SYST:TIM?').split(';')
+        t4 = time.time()
+        instrument = dt.datetime.fromisoformat(self.ParseTimestamp(date, tod))\
+                       .replace(tzinfo = dt.timezone.utc).timestamp()
+        return (t1 + t4)/2 - instrument, t4 - t1, (t1 + t4)/2
 
     def VerifyOperation(self):
         return self.ReadIDN().split(',')[1]
@@ -535,6 +939,46 @@ class FS740:
         """
         return self.query("CALC{0}:STAT?".format(1 if front else 2))
 
+    # averaging times of CalculateStability, 10 ms to 5e7 s in a 1, 2, 5
+    # sequence
+    STABILITY_TAUS = tuple(m*10.0**e for e in range(-2, 8) for m in (1, 2, 5))
+
+    def StatisticsBlock(self, count, gate = 0.1, front = True):
+        """
+        Start a block of <count> frequency measurements of <gate> seconds
+        each that stay in internal memory, for the instrument to compute
+        the statistics and stability of; see ReadStatisticsBlock.
+        """
+        self.ConfigureFrequency(front = front)
+        self.SampleCount(count, front)
+        self.SenseFrequencyGate(gate, front)
+        self.Initiate(front)
+
+    def ReadStatisticsBlock(self, count, front = True):
+        """
+        Summary of a block started with StatisticsBlock, None while fewer
+        than <count> measurements are done. Returns (timestamp, {field:
+        value}) with the mean, Allan deviation, minimum, maximum and
+        number of measurements, and the relative Allan deviation at each
+        of the STABILITY_TAUS the block is long enough for. Only these
+        values cross the link, not the measurements.
+        """
+        if self.DataCount(front) < count:
+            return None
+        n = 1 if front else 2
+        date, tod, stats, stab = self.query(
+            "SYST:DAT?;:SYST:TIM?;:CALC{0}:STAT?;:CALC{0}:STAB?".format(n)
+            ).split(';')
+        mean, adev, low, high, samples = [float(v) for v in stats.split(',')]
+        fields = {"mean":mean, "allanDeviation":adev, "minimum":low,
+                  "maximum":high, "samples":int(samples)}
+        for tau, v in zip(self.STABILITY_TAUS, stab.split(',')):
+            v = float(v)
+            # averaging times beyond the block come back as NaN (9.91e37)
+            if v == v and v < 9.9e37:
+                fields["stability{0:g}s".format(tau)] = v
+        return self.ParseTimestamp(date, tod), fields
+
     #################################################################
     ##########  Data Subsystem                             ##########
     #################################################################
@@ -805,7 +1249,7 @@ class FS740:
         self.set("SAMP{0}:COUN {1}".format(1 if front else 2, count))
 
     def ReadSampleCount(self, front=True):
-        self.set("SAMP{0}:COUN?".format(1 if front else 2))
+        return int(self.query("SAMP{0}:COUN?".format(1 if front else 2)))
 
     #################################################################
     ##########  Sense Subsystem                            ##########
@@ -983,6 +1427,56 @@ class FS740:
         STATus:QUEStionable:ENABle
     """
 
+    # register name, condition query, event query, (bit, flag name)
+    STATUS_REGISTERS = (
+        ('GPS', 'STAT:GPS:COND?', 'STAT:GPS:EVEN?',
+            ((0, 'TimeNotSet'), (1, 'AntennaOpen'), (2, 'AntennaShort'),
+             (3, 'NoSatellites'), (4, 'UTCUnknown'), (5, 'SurveyInProgress'),
+             (6, 'NoPositionStored'), (7, 'LeapSecondPending'),
+             (9, 'PositionQuestionable'), (11, 'AlmanacIncomplete'),
+             (12, 'NoTimingPulses'))),
+        ('Questionable', 'STAT:QUES:COND?', 'STAT:QUES:EVEN?',
+            ((0, 'TimeOfDay'), (1, 'WarmUp'), (2, 'TimeUnlock'),
+             (5, 'FreqStability'), (10, 'RbUnlock'), (11, 'PLLUnlock'),
+             (12, 'EFC10MHz'), (13, 'EFCGPS'))),
+        ('Operation', 'STAT:OPER:COND?', 'STAT:OPER:EVEN?',
+            ((1, 'Setting'), (4, 'MeasureFront'), (5, 'MeasureRear'),
+             (6, 'EventFront'), (7, 'EventRear'))),
+        ('Alarm', 'SYST:ALAR:COND?', 'SYST:ALAR:EVEN?',
+            ((0, 'TimingError'), (1, 'Holdover'))),
+    )
+    # unlike the STATus event registers SYST:ALAR:EVEN? is not cleared
+    # when read
+    STATUS_LATCHED = ('Alarm',)
+    STATUS_BIT_NAMES = dict((name, _bit_names(bits))
+                            for name, _, _, bits in STATUS_REGISTERS)
+    STATUS_QUERY = ';:'.join(['SYST:DAT?', 'SYST:TIM?'] +
+                             [reg[1] for reg in STATUS_REGISTERS] +
+                             [reg[2] for reg in STATUS_REGISTERS])
+
+    def ReadStatusRegisters(self):
+        """
+        Query the date, time and all status condition and event registers
+        with a single compound command.
+        Returns date, time and two dicts mapping register name to the
+        integer condition and event values.
+        """
+        response = self.query(self.STATUS_QUERY).split(';')
+        names = [reg[0] for reg in self.STATUS_REGISTERS]
+        n = len(names)
+        conditions = dict(zip(names, map(int, response[2:2+n])))
+        events = dict(zip(names, map(int, response[2+n:2+2*n])))
+        return response[0], response[1], conditions, events
+
+    @classmethod
+    def DecodeStatus(cls, register, value):
+        """
+        Return the names of the flags set in <value> for the status
+        register <register> ('GPS', 'Questionable', 'Operation' or 'Alarm').
+        """
+        names = cls.STATUS_BIT_NAMES[register]
+        return [names[i] for i in range(len(names)) if value & (1 << i)]
+
     def StatusGPSCondition(self):
         """
         Query the current condition of the GPS receiver.
@@ -1124,6 +1618,10 @@ class FS740:
         """
         Query the condition register for the system alarm.
         Manual p.122
+
+        bit : name
+        0   : Timing error exceeds SYST:ALAR:TINT
+        1   : Holdover longer than SYST:ALAR:HOLD:DUR
         """
         return self.query("SYST:ALAR:COND?")
 
@@ -1157,7 +1655,7 @@ class FS740:
         SYSTem:ALARm:CLEar command.
         Manual p.123
         """
-        return self.query("SYS:ALAR:EVEN?")
+        return self.query("SYST:ALAR:EVEN?")
 
     def SystemAlarmMode(self, mode):
         """
@@ -1590,6 +2088,17 @@ class FS740:
         """
         return self.query("TBAS:EVEN?")
 
+    def TBaseEventDrain(self):
+        """
+        Read all events in the timebase event queue, oldest first.
+        """
+        events = []
+        count = int(self.TBaseEventCount())
+        while count > 0:
+            events += self.query_many(['TBAS:EVEN?']*count)
+            count = int(self.TBaseEventCount())
+        return events
+
     def TBaseState(self):
         """
         Query the current state of the timebase.
@@ -0,0 +1,167 @@
+import time
+import queue
+import itertools
+import threading
+from concurrent.futures import Future
+
+class ClientStats:
+    __slots__ = ('count', 'errors', 'wait', 'service', 'max_latency')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.wait = 0.0
+        self.service = 0.0
+        self.max_latency = 0.0
+
+    def asdict(self):
+        n = max(self.count, 1)
+        return {"count":self.count, "errors":self.errors,
+                "mean_wait":self.wait/n, "mean_service":self.service/n,
+                "max_latency":self.max_latency}
+
+class DeviceBroker:
+    """
+    Owns the single session to an instrument and runs the commands of all
+    its clients (recorder, GUI, notebooks) one at a time on a worker
+    thread, so that their writes and responses never interleave. Waiting
+    commands are served by priority, lowest value first and in order of
+    arrival within a priority, so periodic acquisition at priority 0 is
+    not held up by interactive queries. Queueing and service time are
+    accounted per client.
+
+    A session stuck in I/O is ended by abort(); with <open_instr> the
+    broker then reopens it for the next command.
+    """
+    brokers = {}
+    brokers_lock = threading.Lock()
+
+    def __init__(self, instr, open_instr = None):
+        self.instr = instr
+        self.open_instr = open_instr
+        self.stale = False
+        self.requests = queue.PriorityQueue()
+        self.seq = itertools.count()
+        self.stats_lock = threading.Lock()
+        self.client_stats = {}
+        self.worker = threading.Thread(target = self.run, daemon = True)
+        self.worker.start()
+
+    @classmethod
+    def shared(cls, key, open_instr):
+        """
+        The broker for <key>, opening the session with open_instr() if
+        there is none yet.
+        """
+        with cls.brokers_lock:
+            if key not in cls.brokers:
+                cls.brokers[key] = cls(open_instr(), open_instr)
+            return cls.brokers[key]
+
+    def client(self, name, priority = 10):
+        with self.stats_lock:
+            self.client_stats.setdefault(name, ClientStats())
+        return BrokerTransport(self, name, priority)
+
+    def submit(self, name, priority, method, cmd = None):
+        future = Future()
+        self.requests.put((priority, next(self.seq), time.monotonic(),
+                           name, method, cmd, future))
+        return future
+
+    def run(self):
+        while True:
+            priority, _, t0, name, method, cmd, future = self.requests.get()
+            if method is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            t1 = time.monotonic()
+            try:
+                if self.stale:
+                    self.reopen()
+                func = getattr(self.instr, method)
+                future.set_result(func() if cmd is None else func(cmd))
+                error = False
+            except Exception as e:
+                future.set_exception(e)
+                error = True
+            t2 = time.monotonic()
+            with self.stats_lock:
+                stats = self.client_stats[name]
+                stats.count += 1
+                stats.errors += error
+                stats.wait += t1 - t0
+                stats.service += t2 - t1
+                stats.max_latency = max(stats.max_latency, t2 - t0)
+
+    def abort(self):
+        """
+        Called from another thread to make the command stuck in I/O fail.
+        """
+        self.stale = self.open_instr is not None
+        getattr(self.instr, 'abort', self.instr.close)()
+
+    def reopen(self):
+        try:
+            self.instr.close()
+        except Exception:
+            pass
+        self.instr = self.open_instr()
+        self.stale = False
+
+    def stats(self):
+        """
+        {client: {count, errors, mean_wait, mean_service, max_latency}}
+        with times in seconds.
+        """
+        with self.stats_lock:
+            return dict((name, s.asdict()) for name, s in self.client_stats.items())
+
+    def close(self):
+        # runs after everything already queued
+        self.requests.put((float('inf'), next(self.seq), 0, None, None, None, None))
+        self.worker.join()
+        self.instr.close()
+        with self.brokers_lock:
+            for key, broker in list(self.brokers.items()):
+                if broker is self:
+                    del self.brokers[key]
+
+class BrokerTransport:
+    """
+    Transport handed to a client of a DeviceBroker. query() and write()
+    block until the broker has run them; submit() returns the Future
+    right away, so a driver can queue several queries at once. Closing it
+    leaves the shared session open.
+    """
+    def __init__(self, broker, name, priority):
+        self.broker = broker
+        self.name = name
+        self.priority = priority
+
+    @property
+    def timeout(self):
+        return self.broker.instr.timeout
+
+    def submit(self, cmd):
+        return self.broker.submit(self.name, self.priority, 'query', cmd)
+
+    def query(self, cmd):
+        return self.submit(cmd).result()
+
+    def write(self, cmd):
+        self.broker.submit(self.name, self.priority, 'write', cmd).result()
+
+    def read(self):
+        return self.broker.submit(self.name, self.priority, 'read').result()
+
+    def clear(self):
+        if hasattr(self.broker.instr, 'clear'):
+            self.broker.submit(self.name, self.priority, 'clear').result()
+
+    def abort(self):
+        self.broker.abort()
+
+    def close(self):
+        pass
@@ -0,0 +1,130 @@
+from contextlib import contextmanager
+from collections import namedtuple, OrderedDict
+
+# query: SCPI query, parser: response -> value, group: 'time', 'overview',
+# 'satellites', ...
+Field = namedtuple('Field', 'query parser group')
+
+class ResponseError(ValueError):
+    """
+    A response that is garbled or truncated and fails to parse.
+    """
+
+@contextmanager
+def parsing(what):
+    """
+    Turn the ValueError or IndexError of a parser into a ResponseError,
+    so that only failures to parse a response are taken for garbled I/O.
+    """
+    try:
+        yield
+    except ResponseError:
+        raise
+    except (ValueError, IndexError) as e:
+        raise ResponseError('{0}: {1!r}'.format(what, e)) from e
+
+class QueryPlan:
+    """
+    Compiles a set of fields from a registry {name: Field} into the
+    smallest sequence of compound commands that reads them. Every query is
+    sent once, however many fields are parsed from its response, and
+    queries are joined with ';:' as long as the command stays within
+    <max_command> characters and the expected responses within
+    <max_response>. Fields can be named directly or by group, and the
+    fields of <always> are read first.
+
+    execute() returns a namedtuple plan.Record of the parsed fields.
+    """
+    def __init__(self, registry, fields, always = ('time',),
+                 max_command = 256, max_response = 1024,
+                 response_size = None):
+        requested = list(always) + list(fields)
+        names = []
+        for item in requested:
+            if item in registry:
+                expanded = [item]
+            else:
+                expanded = [name for name, f in registry.items()
+                            if f.group == item]
+                if not expanded:
+                    raise KeyError('unknown field or group {0}'.format(item))
+            names += [name for name in expanded if name not in names]
+        self.fields = tuple(names)
+        self.Record = namedtuple('Record', self.fields)
+
+        # unique queries in order of first use
+        queries = OrderedDict()
+        for name in self.fields:
+            queries.setdefault(registry[name].query, len(queries))
+        self.queries = tuple(queries)
+        self.getters = tuple((registry[name].parser, queries[registry[name].query])
+                             for name in self.fields)
+        self.groups = OrderedDict()
+        for i, name in enumerate(self.fields):
+            self.groups.setdefault(registry[name].group, []).append((name, i))
+
+        # pack queries into compound commands
+        response_size = response_size or {}
+        self.commands = []
+        # (command, position in command, queries in command) of each query
+        self.slots = []
+        command, size = [], 0
+        for query in self.queries:
+            expected = response_size.get(query, 20)
+            if command and (len(';:'.join(command + [query])) > max_command or
+                            size + expected > max_response):
+                self.pack(command)
+                command, size = [], 0
+            command.append(query)
+            size += expected
+        if command:
+            self.pack(command)
+
+    def pack(self, command):
+        self.slots += [(len(self.commands), j, len(command))
+                       for j in range(len(command))]
+        self.commands.append(';:'.join(command))
+
+    def __len__(self):
+        return len(self.commands)
+
+    def execute(self, device):
+        """
+        Send the compound commands through device.query_many and parse the
+        responses into a Record.
+        """
+        return self.parse(device.query_many(self.commands))
+
+    def parse(self, responses):
+        """
+        Parse the responses to the compound commands into a Record.
+        """
+        responses = [r for response in responses for r in response.split(';')]
+        if len(responses) != len(self.queries):
+            raise ResponseError('expected {0} responses, got {1}'
+                                .format(len(self.queries), len(responses)))
+        with parsing('parsing the plan responses'):
+            return self.Record._make(parser(responses[i])
+                                     for parser, i in self.getters)
+
+    def sample_times(self, timings):
+        """
+        Estimated host times at which each query was evaluated, from the
+        (sent, received) host times of the commands. The instrument starts
+        on a command once it is sent and the previous reply is out, and
+        the queries of a compound command are taken to be evenly spread
+        over the time until its reply.
+        """
+        starts = []
+        previous = None
+        for sent, received in timings:
+            starts.append(sent if previous is None else max(sent, previous))
+            previous = received
+        return [starts[c] + (timings[c][1] - starts[c])*(j + 0.5)/n
+                for c, j, n in self.slots]
+
+    def group(self, record, group):
+        """
+        {name: value} of the fields of <group> in <record>.
+        """
+        return dict((name, record[i]) for name, i in self.groups.get(group, ()))
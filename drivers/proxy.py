@@ -0,0 +1,161 @@
+"""
+Local SCPI proxy: holds the single connection to an FS740 and lets several
+local clients share it over TCP with the same line terminated SCPI, e.g.
+the unmodified driver with protocol = 'TCP' and resource_name =
+'localhost:5025'.
+
+    python -m drivers.proxy COM4 --protocol RS232 --port 5025
+
+Identical read-only queries from different clients that are in flight at
+the same time, or were answered less than --window seconds ago, share one
+instrument round trip.
+"""
+import time
+import socket
+import argparse
+import threading
+import socketserver
+
+from .FS740 import FS740, read_only
+from .broker import DeviceBroker
+
+class SCPIProxy(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, broker, window = 0.05):
+        socketserver.ThreadingTCPServer.__init__(self, address, SCPIHandler)
+        self.broker = broker
+        self.window = window
+        self.recent = {}
+        self.recent_lock = threading.Lock()
+        # live and total client connections
+        self.clients_lock = threading.Lock()
+        self.clients = 0
+        self.connections = 0
+        self.queries = 0
+        self.coalesced = 0
+
+    def submit(self, client, cmd):
+        """
+        Future with the response to <cmd>, shared with an identical
+        read-only query in flight or answered within the window.
+        """
+        if not read_only(cmd):
+            return client.submit(cmd)
+        now = time.monotonic()
+        with self.recent_lock:
+            self.queries += 1
+            entry = self.recent.get(cmd)
+            if entry is not None:
+                future, t = entry
+                if not future.done() or now - t < self.window:
+                    self.coalesced += 1
+                    return future
+            future = client.submit(cmd)
+            self.recent[cmd] = (future, now)
+        # outside the lock: a future that is already done runs the
+        # callback right away
+        future.add_done_callback(lambda f: self.answered(cmd, f))
+        return future
+
+    def write(self, client, cmd):
+        # settings may change, later queries must not reuse older answers
+        with self.recent_lock:
+            self.recent.clear()
+        return client.broker.submit(client.name, client.priority, 'write', cmd)
+
+    def answered(self, cmd, future):
+        # the window runs from the moment the response arrived
+        with self.recent_lock:
+            if self.recent.get(cmd, (None,))[0] is future:
+                if future.exception() is None:
+                    self.recent[cmd] = (future, time.monotonic())
+                else:
+                    del self.recent[cmd]
+
+    def stats(self):
+        with self.clients_lock:
+            stats = {"clients":self.clients, "connections":self.connections}
+        stats.update({"queries":self.queries, "coalesced":self.coalesced})
+        stats.update(self.broker.stats())
+        return stats
+
+class SCPIHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        with server.clients_lock:
+            server.clients += 1
+            server.connections += 1
+        try:
+            self.serve(server)
+        finally:
+            with server.clients_lock:
+                server.clients -= 1
+
+    def serve(self, server):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # accounted by host, a client reconnecting every cycle from a new
+        # port is still one client
+        client = server.broker.client(self.client_address[0])
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+            *lines, data = data.split(b'\n')
+            # submit everything the client sent in one go before answering,
+            # so pipelined queries reach the broker together
+            pending = []
+            for line in lines:
+                cmd = line.decode('ascii').strip()
+                if not cmd:
+                    continue
+                if '?' in cmd:
+                    pending.append(server.submit(client, cmd))
+                else:
+                    pending.append(server.write(client, cmd))
+            self.answer(sock, pending)
+
+    def answer(self, sock, pending):
+        out = []
+        for future in pending:
+            try:
+                response = future.result()
+            except Exception:
+                # the instrument did not answer, the client times out as
+                # it would on a direct connection
+                continue
+            if response is not None:
+                out.append(response.encode('ascii') + b'\r\n')
+        if out:
+            sock.sendall(b''.join(out))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Share an FS740 between local clients.')
+    parser.add_argument('resource_name')
+    parser.add_argument('--protocol', default = 'RS232')
+    parser.add_argument('--timeout', type = float, default = 2.0)
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 5025)
+    parser.add_argument('--window', type = float, default = 0.05)
+    args = parser.parse_args()
+
+    rm = None
+    if args.protocol in FS740.VISA_PROTOCOLS:
+        import visa
+        rm = visa.ResourceManager()
+    broker = DeviceBroker.shared(args.resource_name,
+        lambda: FS740(rm, args.resource_name, args.protocol, args.timeout).instr)
+    with SCPIProxy((args.host, args.port), broker, args.window) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(server.stats())
+        finally:
+            broker.close()
+
+if __name__ == "__main__":
+    main()
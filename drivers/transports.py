@@ -0,0 +1,339 @@
+import time
+import socket
+import threading
+from collections import deque
+
+class Reply:
+    """
+    Future for the response to a pipelined query. result() reads responses
+    off the connection, resolving earlier replies in order, until this one
+    has arrived.
+    """
+    __slots__ = ('transport', 'value', 'done')
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.value = None
+        self.done = False
+
+    def result(self):
+        if not self.done:
+            self.transport.resolve(self)
+        return self.value
+
+class SocketTransport:
+    """
+    Line terminated SCPI over a plain TCP socket, a replacement for the
+    pyvisa TCPIP SOCKET resource with the same query/write/read/close
+    interface. Replies are received into one reusable buffer which is
+    scanned for the read termination in place, so a query only allocates
+    the returned string.
+    """
+    def __init__(self, host, port = 5025, timeout = 2.0,
+                 write_termination = '\r\n', read_termination = '\r\n',
+                 bufsize = 4096):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.write_termination = write_termination.encode('ascii')
+        self.read_termination = read_termination.encode('ascii')
+        self.buffer = bytearray(bufsize)
+        self.view = memoryview(self.buffer)
+        # unread data is buffer[start:end], the termination is searched
+        # from scan onwards
+        self.start = 0
+        self.end = 0
+        self.scan = 0
+        # pipelined queries not yet sent and replies not yet read
+        self.outgoing = []
+        self.inflight = deque()
+        self.max_inflight = 32
+
+    @staticmethod
+    def parse_address(address, port = 5025):
+        """
+        Split 'host' or 'host:port' into (host, port).
+        """
+        host, _, p = address.partition(':')
+        return host, int(p) if p else port
+
+    @property
+    def timeout(self):
+        """
+        Timeout in ms, like pyvisa resources.
+        """
+        return self.sock.gettimeout()*1e3
+
+    @timeout.setter
+    def timeout(self, value):
+        self.sock.settimeout(value/1e3)
+
+    def close(self):
+        self.view.release()
+        self.sock.close()
+
+    def abort(self):
+        """
+        Make a read blocked in another thread fail right away.
+        """
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def write(self, cmd):
+        self.outgoing.append(cmd.encode('ascii'))
+        self.flush()
+
+    def flush(self):
+        # queued commands go out back-to-back in a single send
+        if self.outgoing:
+            self.outgoing.append(b'')
+            self.sock.sendall(self.write_termination.join(self.outgoing))
+            self.outgoing = []
+
+    def submit(self, cmd):
+        """
+        Queue a query without waiting for the response and return its
+        Reply. Queries are sent when a reply is first needed, or once
+        max_inflight replies are outstanding.
+        """
+        if len(self.inflight) >= self.max_inflight:
+            self.resolve(self.inflight[0])
+        reply = Reply(self)
+        self.outgoing.append(cmd.encode('ascii'))
+        self.inflight.append(reply)
+        return reply
+
+    def resolve(self, reply):
+        self.flush()
+        while not reply.done:
+            oldest = self.inflight.popleft()
+            oldest.value = self.read()
+            oldest.done = True
+
+    def read(self):
+        term = self.read_termination
+        while True:
+            idx = self.buffer.find(term, self.scan, self.end)
+            if idx >= 0:
+                line = str(self.view[self.start:idx], 'ascii')
+                self.start = self.scan = idx + len(term)
+                if self.start == self.end:
+                    self.start = self.end = self.scan = 0
+                return line
+            self.scan = max(self.start, self.end - len(term) + 1)
+            if self.end == len(self.buffer):
+                self.make_room()
+            n = self.sock.recv_into(self.view[self.end:])
+            if n == 0:
+                raise ConnectionError('connection closed by instrument')
+            self.end += n
+
+    def make_room(self):
+        # move unread data to the front, or double the buffer if it is full
+        n = self.end - self.start
+        if self.start > 0:
+            self.buffer[:n] = bytes(self.view[self.start:self.end])
+        else:
+            self.view.release()
+            self.buffer.extend(bytes(len(self.buffer)))
+            self.view = memoryview(self.buffer)
+        self.scan -= self.start
+        self.start = 0
+        self.end = n
+
+    def query(self, cmd):
+        if self.inflight:
+            return self.submit(cmd).result()
+        self.write(cmd)
+        return self.read()
+
+    def clear(self):
+        """
+        Discard buffered and pending input, e.g. after a timeout left a
+        reply in flight.
+        """
+        self.start = self.end = self.scan = 0
+        self.outgoing = []
+        while self.inflight:
+            self.inflight.popleft().done = True
+        timeout = self.sock.gettimeout()
+        self.sock.settimeout(0)
+        try:
+            while self.sock.recv_into(self.view):
+                pass
+        except (BlockingIOError, socket.timeout):
+            pass
+        finally:
+            self.sock.settimeout(timeout)
+
+class RecordingTransport:
+    """
+    Wraps a transport (pyvisa resource or SocketTransport) and appends
+    every command and response with its timestamp and duration to a
+    gzip compressed session file. Each line is
+
+        time <tab> duration <tab> kind <tab> command <tab> response
+
+    with kind Q for queries, W for writes and R for bare reads. Sessions
+    are appended to the same file as separate gzip members.
+    """
+    def __init__(self, instr, path):
+        import gzip
+        self.instr = instr
+        self.file = gzip.open(path, 'at', encoding = 'ascii')
+
+    @property
+    def timeout(self):
+        return self.instr.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.instr.timeout = value
+
+    def clear(self):
+        self.instr.clear()
+
+    def abort(self):
+        getattr(self.instr, 'abort', self.instr.close)()
+
+    def log(self, t0, kind, cmd, response = ''):
+        self.file.write('{0:.6f}\t{1:.6f}\t{2}\t{3}\t{4}\n'.format(
+                        t0, time.time() - t0, kind, cmd, response))
+
+    def query(self, cmd):
+        t0 = time.time()
+        response = self.instr.query(cmd)
+        self.log(t0, 'Q', cmd, response)
+        return response
+
+    def write(self, cmd):
+        t0 = time.time()
+        self.instr.write(cmd)
+        self.log(t0, 'W', cmd)
+
+    def read(self):
+        t0 = time.time()
+        response = self.instr.read()
+        self.log(t0, 'R', '', response)
+        return response
+
+    def close(self):
+        self.file.close()
+        self.instr.close()
+
+class ReplaySession:
+    """
+    Responses captured by RecordingTransport, shared by all
+    ReplayTransports opened on it so that a sequence of driver sessions
+    continues where the previous one stopped.
+
+    speed  : None replays as fast as possible, otherwise the recorded
+             timing is reproduced, sped up by this factor
+    strict : raise on a command that differs from the recording, instead
+             of skipping ahead to the next matching record
+    loop   : start over at the end of the recording instead of raising
+             EOFError
+    """
+    # open sessions by path and settings, until exhausted or closed
+    sessions = {}
+    sessions_lock = threading.Lock()
+
+    def __init__(self, path, speed = None, strict = True, loop = False):
+        import gzip
+        self.key = None
+        with gzip.open(path, 'rt', encoding = 'ascii') as f:
+            self.records = [line.rstrip('\n').split('\t') for line in f]
+        self.records = [(float(t), float(d), kind, cmd, response)
+                        for t, d, kind, cmd, response in self.records]
+        self.speed = speed
+        self.strict = strict
+        self.loop = loop
+        self.cursor = 0
+        self.lock = threading.Lock()
+        self.t0 = None
+
+    @classmethod
+    def open(cls, path, **kwargs):
+        """
+        Return the session for <path> with these settings, loading it on
+        first use.
+        """
+        key = (path, tuple(sorted(kwargs.items())))
+        with cls.sessions_lock:
+            if key not in cls.sessions:
+                cls.sessions[key] = cls(path, **kwargs)
+                cls.sessions[key].key = key
+            return cls.sessions[key]
+
+    def close(self):
+        """
+        Forget the session, the next open() of its path starts over.
+        """
+        with self.sessions_lock:
+            if self.sessions.get(self.key) is self:
+                del self.sessions[self.key]
+
+    def next(self, kind, cmd):
+        with self.lock:
+            if self.cursor >= len(self.records):
+                if not self.loop or not self.records:
+                    self.close()
+                    raise EOFError('end of replay')
+                self.cursor = 0
+                self.t0 = None
+            record = self.records[self.cursor]
+            if record[2] != kind or record[3] != cmd:
+                if self.strict:
+                    raise ValueError('replay expected {0} {1!r}, got {2} {3!r}'
+                                     .format(record[2], record[3], kind, cmd))
+                # a looping replay continues from the start
+                n = len(self.records)
+                ahead = range(self.cursor, self.cursor + n if self.loop else n)
+                for i in ahead:
+                    if self.records[i % n][2] == kind and \
+                       self.records[i % n][3] == cmd:
+                        break
+                else:
+                    raise ValueError('{0!r} not in remaining replay'.format(cmd))
+                if i >= n:
+                    i -= n
+                    self.t0 = None
+                record = self.records[i]
+                self.cursor = i
+            self.cursor += 1
+
+        if self.speed:
+            # sleep until the response would have arrived in the recording
+            t, duration = record[0], record[1]
+            if self.t0 is None:
+                self.t0 = (time.monotonic(), t)
+            due = self.t0[0] + (t + duration - self.t0[1])/self.speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        return record[4]
+
+class ReplayTransport:
+    """
+    Feeds the responses of a ReplaySession back to an unmodified driver.
+    """
+    def __init__(self, session):
+        self.session = session
+        self.timeout = 0
+
+    def query(self, cmd):
+        return self.session.next('Q', cmd)
+
+    def write(self, cmd):
+        self.session.next('W', cmd)
+
+    def read(self):
+        return self.session.next('R', '')
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
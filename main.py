@@ -1,38 +1,291 @@
 import tkinter as tk
-from tkinter import filedialog
 from tkinter import messagebox
 import os
-import glob
-import pyvisa
-import sys
 import configparser
 import time
-import numpy as np
-import shutil, errno
-import visa
 import atexit
 import threading
-import inspect
+import math
+import pickle
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-from influxdb import InfluxDBClient
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
-from drivers import FS740
+import drivers
+from monitoring import StatusEngine, PointQueue, History, AdaptivePoller, \
+                       CircuitBreaker, Watchdog, DriftEstimator, ClockCorrelator, \
+                       SinkWriter, make_sink, SeriesStore, tracer
+
+# visa and influxdb are slow to import and only needed once recording
+# starts, so they are imported where they are first used
+
+@functools.lru_cache(maxsize = None)
+def driver_args(driver):
+    """
+    Names of the arguments of driver.__init__, excluding self. Read from
+    the code object once per driver instead of through inspect.
+    """
+    code = driver.__init__.__code__
+    return code.co_varnames[1:code.co_argcount]
+
+@functools.lru_cache(maxsize = None)
+def driver_defaults(driver):
+    """
+    Default values of the driver.__init__ arguments that have one, used
+    for settings missing from devices.ini.
+    """
+    defaults = driver.__init__.__defaults__ or ()
+    return dict(zip(driver_args(driver)[-len(defaults):], defaults)) \
+           if defaults else {}
 
 @contextmanager
 def get_connection(*args, **kwargs):
+    from influxdb import InfluxDBClient
     connection = InfluxDBClient(*args, **kwargs)
     try:
         yield connection
     finally:
         connection.close()
 
+def check_connection(**kwargs):
+    with get_connection(**kwargs) as con:
+        con.ping()
+
+class Acquisition:
+    """
+    Reads a device on the recorder schedule: full reads every dt, fast
+    timing reads in between while the adaptive poller asks for them, and
+    failed cycles paced by the circuit breaker. Runs on a thread of the
+    recorder or on its own in a worker process, so it only holds state
+    that can be pickled.
+    """
+    def __init__(self, driver, driver_kwargs, table, dt, read_kwargs,
+                 record, shared, retries, status_engine, poller, breaker,
+                 clock = None, statistics = None):
+        self.driver = driver
+        self.driver_kwargs = driver_kwargs
+        self.table = table
+        self.dt = dt
+        self.read_kwargs = read_kwargs
+        self.record = record
+        self.shared = shared
+        self.retries = retries
+        self.status_engine = status_engine
+        self.poller = poller
+        self.breaker = breaker
+        self.clock = clock
+        # (count, gate, front) of the statistics blocks, and when the
+        # running one is overdue
+        self.statistics = statistics
+        self.block_due = None
+        self.rm = None
+        self.session = None
+        self.io_failures = 0
+        # failed statistics reads, kept apart from the cycle
+        self.statistics_errors = 0
+        self.statistics_error = None
+
+    # what a worker process sends with each heartbeat, so that the parent
+    # and a worker replacing it continue from the same state, e.g. do not
+    # report the status flags that are already set as rising again
+    PROCESS_STATE = ('io_failures', 'breaker', 'statistics_errors',
+                     'statistics_error', 'status_engine', 'poller', 'clock',
+                     'block_due')
+
+    def process_state(self):
+        return dict((name, getattr(self, name)) for name in self.PROCESS_STATE)
+
+    def __getstate__(self):
+        # the visa resource manager and an open session stay behind
+        state = self.__dict__.copy()
+        state['rm'] = None
+        state['session'] = None
+        state['driver_kwargs'] = dict(self.driver_kwargs)
+        if 'resource_manager' in state['driver_kwargs']:
+            state['driver_kwargs']['resource_manager'] = None
+        return state
+
+    def open_device(self):
+        # the visa resource manager is created on first use, off the GUI
+        # thread, and only for protocols that go through visa
+        protocol = self.driver_kwargs.get('protocol')
+        visa_protocols = getattr(self.driver, 'VISA_PROTOCOLS', (protocol,))
+        if self.rm is None and 'resource_manager' in self.driver_kwargs \
+           and protocol in visa_protocols:
+            import visa
+            self.rm = visa.ResourceManager()
+            self.driver_kwargs['resource_manager'] = self.rm
+        if self.shared:
+            device = self.driver.Shared(client = 'recorder', priority = 0,
+                                        **self.driver_kwargs)
+        else:
+            device = self.driver(**self.driver_kwargs)
+        if self.record:
+            device.Record(self.record)
+        if hasattr(device, 'retries'):
+            device.retries = self.retries
+        if hasattr(device, 'tracer'):
+            device.tracer = tracer
+        return device
+
+    def read_cycle(self, full):
+        device = self.session = self.open_device()
+        try:
+            with device:
+                if full:
+                    points = device.ReadPointsINFLUXDB(self.table, **self.read_kwargs)
+                    if self.status_engine:
+                        points += self.status_engine.update(device)
+                else:
+                    points = device.ReadTimingPointsINFLUXDB(self.table)
+                if self.clock:
+                    points += self.clock.update(*device.ReadClockOffset())
+                if self.statistics and full:
+                    points += self.read_statistics(device)
+                return points
+        finally:
+            # a superseded worker leaves the session of its successor
+            if self.session is device:
+                self.session = None
+            self.io_failures += getattr(device, 'failures', 0)
+
+    def read_statistics(self, device):
+        """
+        Points of the statistics block completed since the last cycle,
+        starting the next block once one is done, on the first cycle, and
+        when the running one is overdue, e.g. after the unit was reset.
+        """
+        count, gate, front = self.statistics
+        table = self.table.split(',')[0] + '_statistics'
+        now = time.monotonic()
+        points = []
+        try:
+            if self.block_due is not None:
+                points = device.ReadStatisticsPointsINFLUXDB(table, count, front)
+                if not points and now < self.block_due:
+                    return points
+            device.StatisticsBlock(count, gate, front)
+            self.block_due = now + 2*count*gate + 10
+        except Exception as e:
+            # neither the points already read in this cycle nor the
+            # breaker depend on the statistics
+            self.statistics_errors += 1
+            self.statistics_error = repr(e)
+            try:
+                device.resync()
+            except Exception:
+                pass
+        return points
+
+    def run(self, emit, beat, current, halt, rearm = False):
+        """
+        Read until current() turns false, passing the points of every
+        cycle to emit(points) and the time until the next cycle to
+        beat(seconds). <halt> is the event that cuts the waits short; with
+        <rearm> it is cleared after each wait, so that it can also signal
+        a change of dt.
+        """
+        def pause(wait):
+            beat(wait)
+            if halt.wait(wait) and rearm:
+                halt.clear()
+
+        next_full = time.monotonic()
+        dt = self.dt
+        while current():
+            if self.dt != dt:
+                # the new interval counts from the last full read
+                next_full += self.dt - dt
+                dt = self.dt
+            now = time.monotonic()
+            try:
+                with tracer.span('cycle', root = True, table = self.table,
+                                 full = now >= next_full):
+                    points = self.read_cycle(now >= next_full)
+            except Exception as e:
+                if not current():
+                    break
+                # an instrument that times out or answers garbage is
+                # tried again, paced by the breaker, the worker lives on
+                wait = max(self.breaker.failure(e), next_full - time.monotonic())
+                pause(wait)
+                next_full = max(next_full, time.monotonic())
+                continue
+            if not current():
+                # replaced while blocked, the new worker carries on
+                break
+            self.breaker.success()
+            if now >= next_full:
+                next_full = now + self.dt
+            emit(points)
+
+            wake = next_full
+            overview = [p for p in points
+                        if p["measurement"] == self.table.split(',')[0]]
+            # a cycle without the overview point leaves the pace as it is
+            if self.poller and overview:
+                wake = min(wake, now + self.poller.update(overview[0]["fields"], now))
+            pause(max(0, wake - time.monotonic()))
+
+def acquisition_process(acquisition, conn, stop, control):
+    """
+    Entry point of a worker process. Runs <acquisition> until <stop> is
+    set and reports over the pipe <conn>, one message per frame: a kind
+    byte followed by a pickle, P for the points of a cycle and S for the
+    heartbeat (seconds to next cycle, Acquisition.process_state()). The
+    pipe <control> carries the tracer settings of the parent, see
+    Tracer.handover, checked before every cycle.
+    """
+    def send(kind, payload):
+        conn.send_bytes(kind + pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+
+    def current():
+        while control.poll():
+            trace = control.recv()
+            if trace is None:
+                tracer.stop()
+                continue
+            # the trace of the parent is continued in a file of its own,
+            # <path>.<pid>.json
+            root, ext = os.path.splitext(trace["path"])
+            tracer.start(**dict(trace,
+                                path = '{0}.{1}{2}'.format(root, os.getpid(), ext)))
+        return not stop.is_set()
+
+    tracer.process_name = 'acquisition ' + acquisition.table.split(',')[0]
+    try:
+        acquisition.run(lambda points: send(b'P', points),
+                        lambda wait: send(b'S', (wait, acquisition.process_state())),
+                        current, stop)
+    except (BrokenPipeError, EOFError):
+        # the parent went away
+        pass
+    finally:
+        conn.close()
+        control.close()
+        tracer.stop()
+
 class RecorderINFLUXDB(threading.Thread):
     def __init__(self, host, port, database, table, user, password,
-                 driver, dt, driver_kwargs):
+                 driver, dt, driver_kwargs, queue_size = 100,
+                 backpressure = 'block', spill_dir = None, history_size = 3600,
+                 adaptive = False, fast_dt = 1.0, record = None, fields = None,
+                 shared = False, satellite_store = None, satellite_size = 86400,
+                 satellite_points = True, retries = 2, breaker_threshold = 3,
+                 breaker_cooldown = 10.0, stall_timeout = 60.0, drift = False,
+                 drift_window = 3600.0, efc_gain = None, process = False,
+                 clock = False, sinks = None, statistics = 0,
+                 statistics_gate = 0.1, statistics_front = True,
+                 series_store = None, series_fields = None,
+                 block_timeout = None):
         # thread control
-        threading.Thread.__init__(self)
+        threading.Thread.__init__(self, name = table.split(',')[0] + ' recorder')
         self.active = threading.Event()
+        self.halt = threading.Event()
+        # cuts the wait of an acquisition thread short, on stop and when
+        # the schedule changes
+        self.wake = threading.Event()
 
         # record operating parameters
         self.host = host
@@ -43,22 +296,593 @@ class RecorderINFLUXDB(threading.Thread):
         self.password = password
         self.driver = driver
         self.dt = dt
-        if 'resource_manager' in driver_kwargs:
-            driver_kwargs['resource_manager'] = visa.ResourceManager()
         self.driver_kwargs = driver_kwargs
+        self.verify = None
+        # read the device in a worker process of its own, so that its timing
+        # does not depend on the GIL of the GUI and the other recorders
+        self.process = process
+        # go through the in-process broker session instead of opening the
+        # instrument each cycle, which a worker process cannot share
+        shared = shared and hasattr(driver, 'Shared') and not process
+        # subset of the driver fields to record, all by default
+        read_kwargs = {'fields': fields} if fields else {}
+
+        # drivers exposing their status registers get edge logging
+        status_engine = None
+        if hasattr(self.driver, 'ReadStatusRegisters'):
+            status_engine = StatusEngine(self.table.split(',')[-1])
+
+        # poll the timing error faster during timebase transitions
+        poller = None
+        if adaptive and hasattr(self.driver, 'ReadTimingPointsINFLUXDB'):
+            poller = AdaptivePoller(dt, fast_dt)
+
+        # failed cycles are retried, a dead unit is only probed now and then
+        breaker = CircuitBreaker(breaker_threshold, cooldown = breaker_cooldown)
+
+        # offset of the host clock from the instrument, every cycle
+        correlator = None
+        if clock and hasattr(self.driver, 'ReadClockOffset'):
+            correlator = ClockCorrelator(self.table.split(',')[0] + '_clock')
+
+        # blocks of <statistics> measurements summarized by the instrument,
+        # so that only the summary of each block is read
+        block = None
+        if statistics and hasattr(self.driver, 'ReadStatisticsPointsINFLUXDB'):
+            block = (statistics, statistics_gate, statistics_front)
+
+        self.reader = Acquisition(driver, driver_kwargs, table, dt, read_kwargs,
+                                  record, shared, retries, status_engine,
+                                  poller, breaker, correlator, block)
+
+        # acquisition and writing are decoupled by bounded queues, one per
+        # sink with its own writer thread and watchdog, so that a slow sink
+        # holds up neither acquisition nor the other sinks; further sinks
+        # drop their oldest batches by default instead of blocking
+        self.outputs = OrderedDict()
+        self.queue_size = queue_size
+        self.spill_dir = spill_dir
+        self.stall_timeout = stall_timeout
+        self.add_output('influxdb', {'type':'influxdb', 'host':host,
+                        'port':port, 'database':database, 'user':user,
+                        'password':password},
+                        PointQueue(queue_size, backpressure, spill_dir),
+                        stall_timeout)
+        self.sinks = OrderedDict()
+        for name, settings in (sinks or {}).items():
+            self.add_sink(name, settings)
+        self.queue = self.outputs['influxdb']['queue']
+        # a sink with block backpressure holds up acquisition, and with it
+        # the other sinks, for as long as its writer is behind; if set, it
+        # waits at most this long per cycle and then drops the cycle
+        self.block_timeout = block_timeout
+        self.writer_watchdog = self.outputs['influxdb']['watchdog']
+
+        # recent values for the live plots
+        self.history = History(self.table, maxlen = history_size)
 
-        with self.driver(**driver_kwargs) as device:
+        # satellite tracks in compact arrays, optionally flushed to disk,
+        # instead of or in addition to one InfluxDB series per satellite
+        self.satellites = None
+        self.satellite_table = (self.table.split(',') + [None])[1]
+        if satellite_store:
+            from monitoring.satellites import SatelliteStore
+            self.satellites = SatelliteStore(satellite_size,
+                flush_dir = None if satellite_store == 'memory' else satellite_store)
+        self.satellite_points = satellite_points
+
+        # months of the numeric overview fields in compressed local blocks
+        self.series = None
+        if series_store:
+            self.series = SeriesStore(series_store,
+                **({'fields':series_fields} if series_fields else {}))
+
+        # holdover performance estimated from every timing read
+        self.drift = None
+        if drift:
+            self.drift = DriftEstimator(self.table.split(',')[0] + '_holdover',
+                                        drift_window, efc_gain = efc_gain)
+
+        # acquisition runs on a worker thread, or a worker process and a
+        # thread receiving from it, that is replaced if it stops making
+        # progress, e.g. blocked in I/O; workers of an older generation
+        # exit as soon as they notice
+        self.acquisition_watchdog = Watchdog(stall_timeout)
+        self.acquisition = None
+        self.worker = None
+        self.worker_stop = None
+        # tracer settings to the worker process
+        self.control = None
+        self.generation = 0
+        # a worker process that exits before its first heartbeat, e.g.
+        # failing at startup, is respawned after 1, 2, 4, ... seconds
+        self.worker_ready = False
+        self.early_exits = 0
+        self.respawn_at = None
+
+        # settings changed while running, applied by the supervisor
+        self.changes = deque()
+        # the settings the recorder was made from, see RecorderINFLUXDBGUI
+        self.spec = None
+
+    @property
+    def breaker(self):
+        return self.reader.breaker
+
+    def verify_device(self):
+        with self.reader.open_device() as device:
             self.verify = device.VerifyOperation()
+        return self.verify
 
-    # main recording loop
+    def add_output(self, name, settings, queue, stall_timeout):
+        # outputs is replaced rather than changed, handle() may be
+        # iterating over it
+        outputs = OrderedDict(self.outputs)
+        outputs[name] = OrderedDict([("settings", settings),
+                                     ("queue", queue),
+                                     ("watchdog", Watchdog(stall_timeout)),
+                                     ("writer", None)])
+        self.outputs = outputs
+        self.new_writer(name)
+
+    # [sink <name>] settings that belong to its queue rather than the sink
+    QUEUE_OPTIONS = ('backpressure', 'queue_size', 'spill_dir')
+
+    def add_sink(self, name, settings):
+        """
+        Add the further sink <name> from its [sink <name>] settings, the
+        queue options taken out of them.
+        """
+        self.sinks[name] = dict(settings)
+        settings = dict(settings)
+        policy = settings.pop('backpressure', 'drop-oldest')
+        size = int(settings.pop('queue_size', self.queue_size))
+        sink_spill = settings.pop('spill_dir', None)
+        if policy == 'spill' and not sink_spill:
+            sink_spill = '{0}_{1}'.format(self.spill_dir or 'spill', name)
+        self.add_output(name, settings, PointQueue(size, policy, sink_spill),
+                        self.stall_timeout)
+
+    def remove_sink(self, name):
+        # the writer stops after its current write, handing back a batch
+        # it could not write, then the queued points are returned
+        outputs = OrderedDict(self.outputs)
+        output = outputs.pop(name)
+        self.outputs = outputs
+        del self.sinks[name]
+        output["writer"].retired.set()
+        output["writer"].join(self.stall_timeout)
+        batches = []
+        while True:
+            batch = output["queue"].get(timeout = 0)
+            if batch is None:
+                return batches
+            batches.append(batch)
+
+    def new_writer(self, name):
+        output = self.outputs[name]
+        output["writer"] = SinkWriter(make_sink(output["settings"]),
+                                      output["queue"], self.active,
+                                      output["watchdog"])
+        output["writer"].name = '{0} writer {1}'.format(
+                                self.table.split(',')[0], name)
+        return output["writer"]
+
+    def replace_writer(self, name):
+        # a new writer takes over the queue, the old one finishes its batch
+        tracer.instant('replace_writer', sink = name)
+        self.outputs[name]["writer"].retired.set()
+        self.new_writer(name).start()
+
+    @property
+    def writer(self):
+        return self.outputs['influxdb']['writer']
+
+    def writers_alive(self):
+        return any(output["writer"].is_alive() for output in self.outputs.values())
+
+    def writer_stall(self, now):
+        return max(output["watchdog"].stalled(now)
+                   for output in self.outputs.values())
+
+    def stop(self):
+        self.active.clear()
+        self.halt.set()
+        self.wake.set()
+        if self.worker_stop is not None:
+            self.worker_stop.set()
+
+    def reconfigure(self, dt = None, sink = None, sinks = None):
+        """
+        Change the full read interval, the InfluxDB settings, a (host,
+        port, database, user, password) tuple, and/or the further sinks,
+        {name: settings}, of a running recorder. The supervisor applies
+        them within a second, keeping the instrument session and the
+        queued points of the sinks that stay.
+        """
+        if dt is not None:
+            self.changes.append(('dt', dt))
+        if sink is not None:
+            self.changes.append(('sink', sink))
+        if sinks is not None:
+            self.changes.append(('sinks', sinks))
+
+    def apply_changes(self):
+        while self.changes:
+            kind, value = self.changes.popleft()
+            if kind == 'dt':
+                # from the next cycle on; a worker process has its own copy
+                # of the schedule and is replaced
+                self.dt = self.reader.dt = value
+                if self.reader.poller:
+                    self.reader.poller.dt = value
+                    self.reader.poller.interval = min(self.reader.poller.interval, value)
+                if self.process:
+                    self.restart_acquisition()
+                else:
+                    self.wake.set()
+            elif kind == 'sinks':
+                self.apply_sinks(value)
+            else:
+                self.host, self.port, self.database, self.user, self.password = value
+                self.outputs['influxdb']['settings'].update(zip(
+                    ('host', 'port', 'database', 'user', 'password'), value))
+                self.replace_writer('influxdb')
+
+    def apply_sinks(self, sinks):
+        """
+        Bring the further sinks in line with <sinks>: removed ones are
+        stopped, new ones started, and changed ones get a new writer that
+        takes over their queue, or a new queue with the queued points if
+        the queue options changed.
+        """
+        for name in [n for n in self.sinks if n not in sinks]:
+            self.remove_sink(name)
+        for name, settings in sinks.items():
+            settings = dict(settings)
+            old = self.sinks.get(name)
+            if old == settings:
+                continue
+            if old is not None and all(old.get(key) == settings.get(key)
+                                       for key in self.QUEUE_OPTIONS):
+                self.sinks[name] = settings
+                self.outputs[name]["settings"] = dict(
+                    (key, value) for key, value in settings.items()
+                    if key not in self.QUEUE_OPTIONS)
+                self.replace_writer(name)
+                continue
+            batches = self.remove_sink(name) if name in self.sinks else []
+            self.add_sink(name, settings)
+            for batch in batches:
+                self.outputs[name]["queue"].put(batch, timeout = 0)
+            self.outputs[name]["writer"].start()
+
+    # supervise the acquisition and writer threads
     def run(self):
-        while self.active.is_set():
-            with get_connection(host = self.host, port = int(self.port), username = self.user,
-                                password = self.password) as con,\
-                self.driver(**self.driver_kwargs) as device:
-                con.switch_database(self.database)
-                device.WriteValueINFLUXDB(con, self.table)
-            time.sleep(self.dt)
+        for output in self.outputs.values():
+            output["writer"].start()
+        self.restart_acquisition()
+        try:
+            while self.active.is_set():
+                self.halt.wait(1)
+                self.apply_changes()
+                now = time.monotonic()
+                if self.acquisition_watchdog.check(now) or self.respawn_due(now):
+                    self.restart_acquisition()
+                for name, output in self.outputs.items():
+                    if output["watchdog"].check(now):
+                        self.replace_writer(name)
+        finally:
+            self.active.clear()
+            self.acquisition.join(self.acquisition_watchdog.timeout)
+            if self.worker:
+                self.worker.join(self.acquisition_watchdog.timeout)
+                if self.worker.is_alive():
+                    self.worker.terminate()
+            if self.satellites and self.satellites.flush_dir:
+                self.satellites.flush()
+            if self.series:
+                self.series.close()
+
+    # longest wait before respawning a worker process that keeps exiting
+    max_respawn_delay = 60.0
+
+    def respawn_due(self, now):
+        """
+        True once a worker process that died is to be replaced.
+        """
+        if self.worker is None or self.worker.is_alive() or \
+           not self.active.is_set():
+            return False
+        if self.respawn_at is None:
+            self.early_exits = 0 if self.worker_ready else self.early_exits + 1
+            delay = 0.0
+            if self.early_exits:
+                delay = min(2.0**(self.early_exits - 1), self.max_respawn_delay)
+            self.respawn_at = now + delay
+        return now >= self.respawn_at
+
+    def restart_acquisition(self):
+        """
+        Start a new acquisition worker, retiring the current one. A worker
+        process is terminated, a worker thread has its session aborted so
+        that it is not left blocked in I/O.
+        """
+        self.generation += 1
+        generation = self.generation
+        tracer.instant('restart_acquisition', generation = generation)
+        self.acquisition_watchdog.beat(time.monotonic())
+        name = '{0} acquisition {1}'.format(self.table.split(',')[0], generation)
+        if self.process:
+            import multiprocessing
+            if self.worker is not None:
+                self.worker.terminate()
+                self.worker.join(1)
+            # spawn also on POSIX, forking a process with threads running
+            # may copy held locks
+            ctx = multiprocessing.get_context('spawn')
+            receiver, sender = ctx.Pipe(duplex = False)
+            control, self.control = ctx.Pipe(duplex = False)
+            self.worker_stop = ctx.Event()
+            self.worker_ready = False
+            self.respawn_at = None
+            self.worker = ctx.Process(target = acquisition_process,
+                                      args = (self.reader, sender, self.worker_stop,
+                                              control),
+                                      daemon = True)
+            self.worker.start()
+            sender.close()
+            control.close()
+            if tracer.active:
+                self.forward_trace()
+            self.acquisition = threading.Thread(target = self.receive,
+                                                args = (generation, receiver),
+                                                name = name, daemon = True)
+        else:
+            session, self.reader.session = self.reader.session, None
+            if session is not None:
+                try:
+                    session.AbortSession()
+                except Exception:
+                    pass
+            self.acquisition = threading.Thread(target = self.acquire,
+                                                args = (generation,),
+                                                name = name, daemon = True)
+        self.acquisition.start()
+
+    def forward_trace(self):
+        """
+        Start or stop tracing in the worker process along with the tracer
+        of this process.
+        """
+        if self.worker is None:
+            return
+        try:
+            self.control.send(tracer.handover())
+        except (BrokenPipeError, OSError):
+            # the worker died, its successor gets the trace when started
+            pass
+
+    def current(self, generation):
+        return self.active.is_set() and generation == self.generation
+
+    # main recording loop
+    def acquire(self, generation):
+        try:
+            self.reader.run(self.handle,
+                lambda wait: self.acquisition_watchdog.beat(time.monotonic(), wait),
+                lambda: self.current(generation), self.wake, rearm = True)
+        except Exception:
+            # let the writer drain and exit if acquisition dies
+            if generation == self.generation:
+                self.active.clear()
+            raise
+
+    def receive(self, generation, conn):
+        """
+        Handle the messages of a worker process until it exits or is
+        replaced.
+        """
+        try:
+            while self.current(generation):
+                if not conn.poll(1):
+                    continue
+                frame = conn.recv_bytes()
+                kind, payload = frame[:1], pickle.loads(frame[1:])
+                if kind == b'P':
+                    self.handle(payload)
+                else:
+                    wait, state = payload
+                    self.reader.__dict__.update(state)
+                    self.worker_ready = True
+                    self.acquisition_watchdog.beat(time.monotonic(), wait)
+        except EOFError:
+            # the worker died, the supervisor starts a new one
+            pass
+        finally:
+            conn.close()
+
+    def handle(self, points):
+        with tracer.span('handle', root = True, points = len(points)):
+            self.history.append(points)
+            if self.series:
+                self.series.append_points(points, self.table.split(',')[0])
+            if self.drift:
+                points += self.drift.update(points)
+            if self.satellites:
+                self.satellites.append_points(points, self.satellite_table)
+                if not self.satellite_points:
+                    points = [p for p in points
+                              if p["measurement"] != self.satellite_table]
+            # sinks that never wait get the cycle first
+            for output in sorted(self.outputs.values(),
+                                 key = lambda o: o["queue"].policy == 'block'):
+                self.put(output["queue"], points)
+
+    def put(self, queue, points):
+        """
+        Queue the points of a cycle. A block policy may wait for the
+        writer, which is not a stalled instrument, so the acquisition
+        watchdog is held meanwhile and only I/O can time out.
+        """
+        if queue.policy != 'block':
+            return queue.put(points)
+        self.acquisition_watchdog.hold(time.monotonic())
+        try:
+            return queue.put(points, self.block_timeout)
+        finally:
+            self.acquisition_watchdog.resume(time.monotonic())
+
+    def metrics(self):
+        metrics = self.queue.metrics()
+        metrics.update(self.breaker.metrics())
+        metrics["io_failures"] = self.reader.io_failures
+        if self.reader.statistics:
+            metrics["statistics_errors"] = self.reader.statistics_errors
+            metrics["statistics_error"] = self.reader.statistics_error
+        now = time.monotonic()
+        for name, watchdog in (("acquisition", self.acquisition_watchdog),
+                               ("writer", self.writer_watchdog)):
+            for key, value in watchdog.metrics(now).items():
+                metrics[name + "_" + key] = value
+        metrics["write_failures"] = self.writer.failures
+        metrics["write_latency"] = round(self.writer.last_latency, 3)
+        metrics["sinks"] = OrderedDict()
+        for name, output in self.outputs.items():
+            sink = output["queue"].metrics()
+            sink.update(output["writer"].metrics())
+            sink.update(output["watchdog"].metrics(now))
+            metrics["sinks"][name] = sink
+        return metrics
+
+class LivePlotsGUI(tk.Toplevel):
+    """
+    Satellite sky plot and TInterval and FControl trends of a running
+    recorder. Only the samples added to the recorder history since the last
+    update are copied, and the plots are blitted over a cached background;
+    the axes are only redrawn when the data leaves their limits.
+    """
+    fields = (('TBaseTInterval', 'TInterval [s]'),
+              ('TBaseFControl', 'FControl'))
+
+    def __init__(self, parent, label, recorder, update_ms = 1000):
+        # matplotlib is only loaded when plots are requested
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        tk.Toplevel.__init__(self, parent)
+        self.title(label + " live plots")
+        self.recorder = recorder
+        self.update_ms = update_ms
+        self.count = 0
+        self.background = None
+        maxlen = recorder.history.times.maxlen
+        self.times = deque(maxlen = maxlen)
+        self.values = dict((field, deque(maxlen = maxlen))
+                           for field, _ in self.fields)
+
+        self.fig = Figure(figsize = (12, 4))
+        self.sky = self.fig.add_subplot(1, 3, 1, projection = 'polar')
+        self.sky.set_rlim(0, 90)
+        self.sky.set_theta_direction(-1)
+        self.sky.set_theta_zero_location("N")
+        self.sky.set_thetagrids((0, 90, 180, 270), ('N', 'E', 'S', 'W'))
+        self.sky.set_yticklabels([])
+        self.scatter = self.sky.scatter([], [], animated = True)
+        self.sat_labels = [self.sky.text(0, 0, '', animated = True,
+                                         ha = 'center', va = 'center',
+                                         fontsize = 8)
+                           for i in range(20)]
+
+        self.axes = OrderedDict()
+        self.lines = OrderedDict()
+        for i, (field, ylabel) in enumerate(self.fields):
+            ax = self.fig.add_subplot(1, 3, i+2)
+            ax.set_xlabel('time [s]')
+            ax.set_ylabel(ylabel)
+            self.axes[field] = ax
+            self.lines[field], = ax.plot([], [], animated = True)
+        self.fig.tight_layout()
+
+        self.canvas = FigureCanvasTkAgg(self.fig, master = self)
+        self.canvas.get_tk_widget().pack(fill = tk.BOTH, expand = True)
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.draw()
+        self.after_id = self.after(0, self.update_plots)
+
+    def destroy(self):
+        self.after_cancel(self.after_id)
+        tk.Toplevel.destroy(self)
+
+    def on_draw(self, event):
+        # a full draw leaves out the animated artists, cache it as the
+        # background and put them back on top
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_artists()
+
+    def draw_artists(self):
+        self.sky.draw_artist(self.scatter)
+        for text in self.sat_labels:
+            self.sky.draw_artist(text)
+        for field, line in self.lines.items():
+            self.axes[field].draw_artist(line)
+
+    def rescale(self):
+        """
+        Adjust limits that no longer fit the data; returns True if any
+        changed and a full redraw is needed.
+        """
+        if not self.times:
+            return False
+        changed = False
+        t0 = self.times[0]
+        t1 = self.times[-1]
+        for field, ax in self.axes.items():
+            xmin, xmax = ax.get_xlim()
+            if t1 > xmax or t0 > xmin + 0.5*(xmax - xmin) or t0 < xmin:
+                ax.set_xlim(t0, t1 + max(60, 0.25*(t1 - t0)))
+                changed = True
+            values = [v for v in self.values[field] if v == v]
+            if not values:
+                continue
+            ymin, ymax = ax.get_ylim()
+            vmin, vmax = min(values), max(values)
+            if vmin < ymin or vmax > ymax:
+                margin = 0.1*(vmax - vmin) or abs(vmax)*0.1 or 1e-9
+                ax.set_ylim(vmin - margin, vmax + margin)
+                changed = True
+        return changed
+
+    def update_plots(self):
+        self.after_id = self.after(self.update_ms, self.update_plots)
+        count, times, values, satellites = self.recorder.history.since(self.count)
+        if count == self.count:
+            return
+        self.count = count
+
+        self.times.extend(times)
+        for field, line in self.lines.items():
+            self.values[field].extend(values[field])
+            line.set_data(self.times, self.values[field])
+
+        self.scatter.set_offsets([(math.radians(azi), 90-ele)
+                                  for _, _, ele, azi in satellites] or
+                                 [(float('nan'), float('nan'))])
+        self.scatter.set_sizes([sig**1.9/4 for _, sig, _, _ in satellites])
+        for i, text in enumerate(self.sat_labels):
+            if i < len(satellites):
+                sat_id, _, ele, azi = satellites[i]
+                text.set_position((math.radians(azi), 90-ele+6.7))
+                text.set_text(str(sat_id))
+            else:
+                text.set_text('')
+
+        if self.rescale() or self.background is None:
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.draw_artists()
+            self.canvas.blit(self.fig.bbox)
 
 class RecorderINFLUXDBGUI(tk.Frame):
     def __init__(self, parent, *args, **kwargs):
@@ -79,8 +903,24 @@ class RecorderINFLUXDBGUI(tk.Frame):
         stop_button = tk.Button(control_frame,
                 text="\u2b1b Stop recording", command = self.stop_recording)\
                 .grid(row=0, column=1)
+        plots_button = tk.Button(control_frame,
+                text="Live plots", command = self.show_plots)\
+                .grid(row=0, column=3)
+        apply_button = tk.Button(control_frame,
+                text="Apply settings", command = self.apply_config)\
+                .grid(row=0, column=4)
+        trace_button = tk.Button(control_frame,
+                text="Trace", command = self.toggle_trace)\
+                .grid(row=0, column=5)
 
         self.status = "stopped"
+        self.recorders = OrderedDict()
+        self.pending = OrderedDict()
+        # recorders added or replaced while recording, waiting for their
+        # check, and recorders of removed or replaced devices finishing
+        self.launching = OrderedDict()
+        self.retiring = []
+        self.pool = ThreadPoolExecutor(max_workers = 4)
         self.status_message = tk.StringVar()
         self.status_message.set("Ready to Record")
         self.status_label = tk.Label(control_frame, textvariable=self.status_message,
@@ -125,10 +965,17 @@ class RecorderINFLUXDBGUI(tk.Frame):
         # devices
         ########################################
 
-        devices_frame = tk.LabelFrame(self.parent, text="Devices")
-        devices_frame.grid(row=2, padx=10, pady=10, sticky='nsew')
+        self.devices_frame = tk.LabelFrame(self.parent, text="Devices")
+        self.devices_frame.grid(row=2, padx=10, pady=10, sticky='nsew')
+        self.device_GUI_list = OrderedDict()
+        self.make_device_rows()
 
+    def make_device_rows(self):
         # make the GUI elements and their variables for the list of devices
+        for widgets in self.device_GUI_list.values():
+            for widget in widgets.values():
+                widget.destroy()
+        devices_frame = self.devices_frame
         self.device_GUI_list = OrderedDict()
         for d in self.parent.devices:
 
@@ -138,9 +985,8 @@ class RecorderINFLUXDBGUI(tk.Frame):
                 ("dt"        , tk.Entry(devices_frame, textvariable=self.parent.devices[d]["dt"], width=5)),
                 ("unit"      , tk.Label(devices_frame, text="s", width = 5))
             ])
-            signature = inspect.getargspec(self.parent.devices[d]["driver"].__init__)
-            driver_args  = signature.args[1:]
-            for arg in driver_args:
+            dargs = driver_args(self.parent.devices[d]["driver"])
+            for arg in dargs:
                 self.device_GUI_list[d][arg] =\
                 tk.Entry(devices_frame, textvariable=self.parent.devices[d][arg], width=15)
                 self.device_GUI_list[d][arg+'_label'] =\
@@ -151,61 +997,314 @@ class RecorderINFLUXDBGUI(tk.Frame):
             for j,key in enumerate(self.device_GUI_list[d]):
                 self.device_GUI_list[d][key].grid(row=i,column=j,sticky=tk.W)
 
+    # InfluxDB settings of a recorder that can change without restarting it
+    SINK_SETTINGS = ('host', 'port', 'database', 'user', 'password')
+
+    def recorder_spec(self, key):
+        """
+        Keyword arguments of the RecorderINFLUXDB for device <key> from the
+        current settings, None if the device is disabled.
+        """
+        d = self.parent.devices[key]
+        if not d["enabled"].get():
+            return None
+        dargs = driver_args(d["driver"])
+        options = d["options"]
+        return OrderedDict([
+            ("host", self.parent.config["host"].get()),
+            ("port", self.parent.config["port"].get()),
+            ("database", self.parent.config["database"].get()),
+            ("table", d["table"]),
+            ("user", self.parent.config["user"].get()),
+            ("password", self.parent.config["password"].get()),
+            ("driver", d["driver"]),
+            ("dt", float(d['dt'].get())),
+            ("driver_kwargs", OrderedDict({arg: d[arg].get() for arg in dargs})),
+            ("queue_size", int(options.get("queue_size", 100))),
+            ("backpressure", options.get("backpressure", "block")),
+            ("spill_dir", options.get("spill_dir", os.path.join("spill", key))),
+            ("history_size", int(options.get("history_size", 3600))),
+            ("adaptive", options.get("adaptive", "0") == "1"),
+            ("fast_dt", float(options.get("fast_dt", 1.0))),
+            ("record", options.get("record")),
+            ("shared", options.get("shared", "0") == "1"),
+            ("satellite_store", options.get("satellite_store")),
+            ("satellite_size", int(options.get("satellite_size", 86400))),
+            ("satellite_points", options.get("satellite_points", "1") == "1"),
+            ("retries", int(options.get("retries", 2))),
+            ("breaker_threshold", int(options.get("breaker_threshold", 3))),
+            ("breaker_cooldown", float(options.get("breaker_cooldown", 10.0))),
+            ("stall_timeout", float(options.get("stall_timeout", 60.0))),
+            ("drift", options.get("drift", "0") == "1"),
+            ("drift_window", float(options.get("drift_window", 3600.0))),
+            ("efc_gain", float(options["efc_gain"]) if "efc_gain" in options else None),
+            ("process", options.get("process", "0") == "1"),
+            ("clock", options.get("clock", "0") == "1"),
+            ("statistics", int(options.get("statistics", 0))),
+            ("statistics_gate", float(options.get("statistics_gate", 0.1))),
+            ("statistics_front", options.get("statistics_input", "front") == "front"),
+            ("series_store", options.get("series_store")),
+            ("series_fields", [f.strip() for f in
+                               options.get("series_fields", "").split(",")
+                               if f.strip()]),
+            ("block_timeout", float(options["block_timeout"])
+                              if "block_timeout" in options else None),
+            ("sinks", OrderedDict((name, dict(sink))
+                                  for name, sink in self.parent.sinks.items())),
+            ("fields", [f.strip() for f in options.get("fields", "").split(",")
+                        if f.strip()]),
+        ])
+
+    @staticmethod
+    def make_recorder(spec):
+        # the recorder gets its own copy of the driver arguments, which it
+        # fills in, so that spec still compares equal to the settings
+        recorder = RecorderINFLUXDB(**dict(spec,
+                        driver_kwargs = OrderedDict(spec["driver_kwargs"])))
+        recorder.spec = spec
+        return recorder
 
     def start_recording(self):
-        # check we're not recording already
-        if self.status == "recording":
+        # check we're not recording, starting or stopping already
+        if self.status != "stopped":
+            return
+        if any(not f.done() for f in self.pending.values()):
+            self.status_message.set("Waiting for previous connection attempt")
             return
 
-        # check influxdb host
+        # read the settings here, the workers only see copies
+        self.parent.save_config()
         host = self.parent.config["host"].get()
         port = self.parent.config["port"].get()
         user = self.parent.config["user"].get()
         password = self.parent.config["password"].get()
-        database = self.parent.config["database"].get()
-        with get_connection(host = host, port = int(port), username = user,
-                            password = password) as con:
-            try:
-                con.ping()
-            except:
-                messagebox.showerror("Connection Error", "Error: cannot connect to INFLUXDB database")
-                self.status_message.set("Error: cannot connect to INFLUXDB database")
-                return
 
-        # connect to devices and check they respond correctly
+        self.recorders = OrderedDict()
         for key in self.parent.devices:
-            signature = inspect.getargspec(self.parent.devices[key]["driver"].__init__)
-            driver_args  = signature.args[1:]
-            d = self.parent.devices[key]
-            kwargs_recorder = OrderedDict({arg: d[arg].get() for arg in driver_args})
-            if d["enabled"].get():
-                d["recorder"] = RecorderINFLUXDB(host, port, database, d["table"], user,
-                                         password,
-                                         d["driver"], float(d['dt'].get()),
-                                         kwargs_recorder)
-                if d["recorder"].verify != d["correct_response"]:
-                    messagebox.showerror("Device error",
-                            "Error: " + d["label"] + " not responding correctly.")
-                    self.status_message.set("Device configuration error")
-                    return
-                d["recorder"].active.set()
+            spec = self.recorder_spec(key)
+            if spec is not None:
+                self.recorders[key] = self.make_recorder(spec)
+
+        # check influxdb host and the devices in the background
+        self.pending = OrderedDict()
+        self.pending[None] = self.pool.submit(check_connection, host = host,
+                port = int(port), username = user, password = password)
+        for key, recorder in self.recorders.items():
+            self.pending[key] = self.pool.submit(recorder.verify_device)
+
+        self.status = "starting"
+        self.poll_start()
+
+    def start_error(self, title, message):
+        for future in self.pending.values():
+            future.cancel()
+        messagebox.showerror(title, "Error: " + message)
+        self.status = "stopped"
+        self.status_message.set("Error: " + message)
+
+    def poll_start(self):
+        # stop_recording cancelled the start
+        if self.status != "starting":
+            return
+
+        done = 0
+        for key, future in self.pending.items():
+            if not future.done():
+                continue
+            done += 1
+            d = self.parent.devices.get(key)
+            if future.exception() is not None or \
+               (key is not None and future.result() != d["correct_response"]):
+                if key is None:
+                    self.start_error("Connection Error",
+                                     "cannot connect to INFLUXDB database")
+                else:
+                    self.start_error("Device error",
+                                     d["label"] + " not responding correctly.")
+                return
+
+        if done < len(self.pending):
+            self.status_message.set("Connecting ({0}/{1} checks done)".format(
+                                    done, len(self.pending)))
+            self.after(100, self.poll_start)
+            return
 
         # start all recorders
-        for key in self.parent.devices:
-            if self.parent.devices[key]["enabled"].get():
-                self.parent.devices[key]["recorder"].start()
+        for key, recorder in self.recorders.items():
+            self.parent.devices[key]["recorder"] = recorder
+            recorder.active.set()
+            recorder.start()
 
         # update status
         self.status = "recording"
         self.status_message.set("Recording")
+        self.update_metrics()
+
+    def update_metrics(self):
+        if self.status != "recording":
+            return
+        depth = [r.metrics()["depth"] for r in self.recorders.values()
+                 if r.is_alive()]
+        tripped = [self.parent.devices[key]["label"]
+                   for key, r in self.recorders.items()
+                   if r.is_alive() and r.breaker.state == 'open']
+        now = time.monotonic()
+        stalled = ["{0} {1:.0f} s".format(self.parent.devices[key]["label"],
+                       max(r.acquisition_watchdog.stalled(now),
+                           r.writer_stall(now)))
+                   for key, r in self.recorders.items()
+                   if r.is_alive() and (r.acquisition_watchdog.stalled(now) or
+                                        r.writer_stall(now))]
+        message = "Recording (queue {0})".format(max(depth) if depth else 0)
+        if tripped:
+            message += ", not responding: " + ", ".join(tripped)
+        if stalled:
+            message += ", stalled: " + ", ".join(stalled)
+        if tracer.active:
+            message += ", tracing"
+        self.status_message.set(message)
+        self.after(1000, self.update_metrics)
+
+    def show_plots(self):
+        if self.status != "recording":
+            self.status_message.set("Live plots need a running recording")
+            return
+        try:
+            for key, recorder in self.recorders.items():
+                LivePlotsGUI(self, self.parent.devices[key]["label"], recorder)
+        except ImportError:
+            messagebox.showerror("Live plots", "Error: matplotlib is not installed")
+
+    def toggle_trace(self):
+        """
+        Trace the recorders (cycles, queries, parsing, writes) for the
+        duration in the [trace] section of settings.ini, 300 s by default,
+        or end a running trace early. The trace goes to the [trace] path,
+        where {0} is replaced by the start time, and can be opened in
+        Perfetto.
+        """
+        if tracer.active:
+            path = tracer.stop()
+            for recorder in self.recorders.values():
+                recorder.forward_trace()
+            self.status_message.set("Trace written to {0}".format(path))
+            return
+        settings = self.parent.trace
+        path = settings.get("path", "trace_{0}.json").format(
+                            time.strftime("%Y%m%d_%H%M%S"))
+        tracer.start(path, float(settings.get("duration", 300)),
+                     float(settings.get("sample", 1.0)))
+        for recorder in self.recorders.values():
+            recorder.forward_trace()
+        self.status_message.set("Tracing to {0}".format(path))
+
+    def apply_config(self):
+        """
+        Save the settings and bring a running recording in line with
+        them, touching only what changed: a new read interval, InfluxDB
+        server or further sinks are applied to the running recorder,
+        devices that were added or enabled are checked and started,
+        removed or disabled ones stopped, and only devices with other
+        changes are restarted.
+        Recorders of unchanged devices keep their session and schedule.
+        """
+        self.parent.save_config()
+        if self.status != "recording":
+            return
+        try:
+            specs = OrderedDict((key, self.recorder_spec(key))
+                                for key in self.parent.devices)
+        except ValueError as e:
+            self.status_message.set("Error: settings not applied, {0}".format(e))
+            return
+        for key, recorder in list(self.recorders.items()):
+            spec = specs.get(key)
+            if spec == recorder.spec:
+                continue
+            changed = set(k for k in recorder.spec if spec is None or
+                          spec[k] != recorder.spec[k])
+            if spec is not None and \
+               changed <= set(self.SINK_SETTINGS + ('dt', 'sinks')):
+                sink = None
+                if changed & set(self.SINK_SETTINGS):
+                    sink = tuple(spec[k] for k in self.SINK_SETTINGS)
+                recorder.reconfigure(spec["dt"] if 'dt' in changed else None, sink,
+                                     spec["sinks"] if 'sinks' in changed else None)
+                recorder.spec = spec
+                continue
+            recorder.stop()
+            self.retiring.append((key, recorder))
+            del self.recorders[key]
+        for key, spec in specs.items():
+            if spec is None or key in self.recorders:
+                continue
+            launching = self.launching.pop(key, None)
+            if launching is not None:
+                launching[1].cancel()
+            recorder = self.make_recorder(spec)
+            self.launching[key] = (recorder, self.pool.submit(
+                                   self.verify_when_free, key, recorder))
+        self.poll_apply()
+
+    def verify_when_free(self, key, recorder):
+        # the device may still be open by the recorder being replaced
+        while any(k == key and r.is_alive() for k, r in self.retiring):
+            time.sleep(0.1)
+        return recorder.verify_device()
+
+    def poll_apply(self):
+        self.retiring = [(k, r) for k, r in self.retiring
+                         if r.is_alive() or r.writers_alive()]
+        for key, (recorder, future) in list(self.launching.items()):
+            if not future.done():
+                continue
+            del self.launching[key]
+            d = self.parent.devices.get(key)
+            if future.cancelled() or d is None or self.status != "recording":
+                continue
+            if future.exception() is not None or \
+               future.result() != d["correct_response"]:
+                self.status_message.set("Error: " + d["label"] +
+                                        " not responding correctly.")
+                continue
+            d["recorder"] = recorder
+            self.recorders[key] = recorder
+            recorder.active.set()
+            recorder.start()
+        if self.launching:
+            self.after(100, self.poll_apply)
 
     def stop_recording(self):
-        if self.status == "stopped":
+        if self.status == "starting":
+            for future in self.pending.values():
+                future.cancel()
+            self.status = "stopped"
+            self.status_message.set("Start cancelled")
             return
-        for key in self.parent.devices:
-            recorder = self.parent.devices[key].get("recorder")
-            if recorder:
-                recorder.active.clear()
+        if self.status != "recording":
+            return
+        for recorder, future in self.launching.values():
+            future.cancel()
+        self.launching.clear()
+        for recorder in self.recorders.values():
+            recorder.stop()
+        self.status = "stopping"
+        self.poll_stop()
+
+    def poll_stop(self):
+        # the recorders close their session at the end of the current cycle,
+        # wait for both threads of each before allowing a new start
+        alive = [key for key, r in list(self.recorders.items()) + self.retiring
+                 if r.is_alive() or r.writers_alive()]
+        if alive:
+            self.status_message.set("Stopping ({0} running)".format(len(alive)))
+            self.after(100, self.poll_stop)
+            return
+        for recorder in self.recorders.values():
+            recorder.join()
+            for output in recorder.outputs.values():
+                output["writer"].join()
+        self.retiring = []
         self.status = "stopped"
         self.status_message.set("Recording finished")
 
@@ -216,40 +1315,112 @@ class CentrexClockGUI(tk.Frame):
         self.parent = parent
         atexit.register(self.save_config)
 
-        # read program settings
+        # read program settings and the list of devices, and pick up
+        # changes to the files while running
         self.config = {}
+        self.devices = OrderedDict()
+        self.read_config()
+        self.mtimes = self.config_mtimes()
+
+        # GUI elements
+        self.recordergui = RecorderINFLUXDBGUI(self, *args, **kwargs)
+        self.recordergui.grid(row=0, column=0)
+        self.after(2000, self.watch_config)
+
+    CONFIG_FILES = ("config/settings.ini", "config/devices.ini")
+
+    def config_mtimes(self):
+        return [os.path.getmtime(f) if os.path.exists(f) else None
+                for f in self.CONFIG_FILES]
+
+    def gui_values(self):
+        # what the entries and check boxes show, to tell unsaved edits
+        values = [(key, var.get()) for key, var in self.config.items()]
+        for d, device in self.devices.items():
+            values += [(d, key, var.get()) for key, var in device.items()
+                       if isinstance(var, tk.Variable)]
+        return values
+
+    def watch_config(self):
+        mtimes = self.config_mtimes()
+        if mtimes != self.mtimes:
+            self.mtimes = mtimes
+            if self.gui_values() != self.saved and not messagebox.askyesno(
+                    "Settings changed",
+                    "The config files changed on disk. Reload them and "
+                    "discard the changes made here?"):
+                self.recordergui.status_message.set(
+                        "Config files changed on disk, not reloaded")
+                self.after(2000, self.watch_config)
+                return
+            try:
+                self.read_config()
+            except (configparser.Error, KeyError, ValueError, AttributeError) as e:
+                self.recordergui.status_message.set(
+                        "Error: config not reloaded, {0}".format(e))
+            else:
+                self.recordergui.make_device_rows()
+                self.recordergui.apply_config()
+        self.after(2000, self.watch_config)
+
+    def read_config(self):
+        """
+        Read settings.ini and devices.ini into the GUI variables. Devices
+        already present keep their variables, and the recorder running for
+        them, so that the settings can be compared and applied.
+        """
         settings = configparser.ConfigParser()
         settings.read("config/settings.ini")
+        # [sink <name>] sections add sinks next to the main InfluxDB
+        self.sinks = OrderedDict((sect.split(None, 1)[1], OrderedDict(settings[sect]))
+                                 for sect in settings.sections()
+                                 if sect.startswith('sink '))
+        # [trace] settings of the Trace button
+        self.trace = OrderedDict(settings['trace']) \
+                     if settings.has_section('trace') else OrderedDict()
         for sect in settings.sections():
+            if sect.startswith('sink ') or sect == 'trace':
+                continue
             for key in settings[sect]:
-                self.config[key] = tk.StringVar()
+                if key not in self.config:
+                    self.config[key] = tk.StringVar()
                 self.config[key].set(settings[sect][key])
 
-        # read list of devices
-        self.devices = OrderedDict()
         devices = configparser.ConfigParser()
         devices.read("config/devices.ini")
+        new_devices = OrderedDict()
         for d in devices.sections():
-            signature = inspect.getargspec(eval(devices[d]["driver"]).__init__)
-            driver_args  = signature.args[1:]
-            self.devices[d] = OrderedDict([
-                        ("label"             , devices[d]["label"]),
-                        ("driver"            , eval(devices[d]["driver"])),
-                        ("table"             , devices[d]["table"]),
-                        ("dt"                , tk.StringVar()),
-                        ("enabled"           , tk.IntVar()),
-                        ("correct_response"  , devices[d]["correct_response"]),
-                    ])
-            self.devices[d]["enabled"].set(devices[d].getboolean("enabled"),)
-            self.devices[d]["dt"].set(devices[d].getfloat("dt"),)
-
-            for arg in driver_args:
-                self.devices[d][arg] = tk.StringVar()
-                self.devices[d][arg].set(devices[d][arg])
+            driver = getattr(drivers, devices[d]["driver"])
+            dargs = driver_args(driver)
+            defaults = driver_defaults(driver)
+            device = self.devices.get(d)
+            if device is None or device["driver"] is not driver:
+                device = OrderedDict([
+                            ("label"             , None),
+                            ("driver"            , driver),
+                            ("table"             , None),
+                            ("dt"                , tk.StringVar()),
+                            ("enabled"           , tk.IntVar()),
+                            ("correct_response"  , None),
+                        ])
+                for arg in dargs:
+                    device[arg] = tk.StringVar()
+            device["label"] = devices[d]["label"]
+            device["table"] = devices[d]["table"]
+            device["correct_response"] = devices[d]["correct_response"]
+            device["enabled"].set(devices[d].getboolean("enabled"),)
+            device["dt"].set(devices[d].getfloat("dt"),)
 
-        # GUI elements
-        self.recordergui = RecorderINFLUXDBGUI(self, *args, **kwargs)
-        self.recordergui.grid(row=0, column=0)
+            for arg in dargs:
+                device[arg].set(devices[d].get(arg, defaults.get(arg, '')))
+
+            # optional recorder settings (queue_size, backpressure, ...)
+            known = list(device) + list(dargs)
+            device["options"] = OrderedDict(
+                    (key, devices[d][key]) for key in devices[d] if key not in known)
+            new_devices[d] = device
+        self.devices = new_devices
+        self.saved = self.gui_values()
 
     def save_config(self):
         # write program settings to disk
@@ -262,14 +1433,17 @@ class CentrexClockGUI(tk.Frame):
                     ('user'      , self.config['user'].get()),
                     ('password'  , self.config['password'].get()),
                 ])
+            for name, sink in self.sinks.items():
+                settings['sink ' + name] = sink
+            if self.trace:
+                settings['trace'] = self.trace
             settings.write(settings_f)
 
         # write device configuration to disk
         with open("config/devices.ini", 'w') as dev_f:
             dev = configparser.ConfigParser()
             for d in self.devices:
-                signature = inspect.getargspec(self.devices[d]["driver"].__init__)
-                driver_args  = signature.args[1:]
+                dargs = driver_args(self.devices[d]["driver"])
                 dev[d] = OrderedDict([
                         ("label"             , self.devices[d]["label"]),
                         ("driver"            , self.devices[d]["driver"].__name__),
@@ -278,9 +1452,14 @@ class CentrexClockGUI(tk.Frame):
                         ("enabled"           , self.devices[d]["enabled"].get()),
                         ("correct_response"  , self.devices[d]["correct_response"]),
                 ])
-                for arg in driver_args:
+                for arg in dargs:
                     dev[d][arg] = self.devices[d][arg].get()
+                for key, value in self.devices[d]["options"].items():
+                    dev[d][key] = value
             dev.write(dev_f)
+        # our own changes are not a reason to reload
+        self.mtimes = self.config_mtimes()
+        self.saved = self.gui_values()
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,11 @@
+from .status import StatusEngine
+from .pipeline import PointQueue
+from .history import History
+from .adaptive import AdaptivePoller
+from .breaker import CircuitBreaker
+from .watchdog import Watchdog
+from .drift import DriftEstimator
+from .clock import ClockCorrelator
+from .sinks import InfluxDBSink, FileSink, SinkWriter, make_sink
+from .series import SeriesStore
+from .trace import tracer
@@ -0,0 +1,46 @@
+class AdaptivePoller:
+    """
+    Chooses the interval of the fast timing poll of a recorder from the
+    timebase state and timing error. Outside of LOCK, or when the timing
+    error comes within <limit_fraction> of the holdover limit, the interval
+    drops to <fast_dt>. Once locked and within bounds for <settle> seconds
+    it grows by <decay> per poll back to the baseline <dt>, at which point
+    only the full reads remain.
+    """
+    def __init__(self, dt, fast_dt = 1.0, limit_fraction = 0.5,
+                 settle = 300.0, decay = 1.5):
+        self.dt = dt
+        self.fast_dt = min(fast_dt, dt)
+        self.limit_fraction = limit_fraction
+        self.settle = settle
+        self.decay = decay
+        self.interval = dt
+        self.limit = None
+        self.calm_since = None
+
+    @property
+    def active(self):
+        return self.interval < self.dt
+
+    def update(self, fields, now):
+        """
+        Update from the overview fields of the latest read, taken at
+        monotonic time <now>, and return the next poll interval.
+        """
+        self.limit = fields.get('TBaseTIntervalLimit', self.limit)
+        state = fields.get('TBaseState')
+        tint = fields.get('TBaseTInterval')
+        if state is None or tint is None:
+            return self.interval
+
+        near_limit = self.limit is not None and \
+                     abs(tint) >= self.limit_fraction*self.limit
+        if state != 'LOCK' or near_limit:
+            self.interval = self.fast_dt
+            self.calm_since = None
+        elif self.active:
+            if self.calm_since is None:
+                self.calm_since = now
+            if now - self.calm_since >= self.settle:
+                self.interval = min(self.dt, self.interval*self.decay)
+        return self.interval
@@ -0,0 +1,45 @@
+class CircuitBreaker:
+    """
+    Paces a recorder through instrument failures. Isolated failures are
+    retried after <delay> seconds; after <threshold> consecutive failed
+    cycles the circuit opens and polling pauses for <cooldown> seconds,
+    doubling with every further failure up to <max_cooldown>, so a unit
+    that is switched off or unplugged is probed now and then instead of
+    in a tight loop. The first successful cycle closes it again.
+    """
+    def __init__(self, threshold = 3, delay = 1.0, cooldown = 10.0,
+                 max_cooldown = 600.0):
+        self.delay = delay
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.consecutive = 0
+        self.failures = 0
+        self.trips = 0
+        self.last_error = None
+
+    @property
+    def state(self):
+        return 'open' if self.consecutive >= self.threshold else 'closed'
+
+    def success(self):
+        self.consecutive = 0
+
+    def failure(self, error):
+        """
+        Record a failed cycle and return the seconds to wait before the
+        next attempt.
+        """
+        self.consecutive += 1
+        self.failures += 1
+        self.last_error = repr(error)
+        n = self.consecutive - self.threshold
+        if n < 0:
+            return self.delay
+        if n == 0:
+            self.trips += 1
+        return min(self.cooldown*2**n, self.max_cooldown)
+
+    def metrics(self):
+        return {"state":self.state, "cycle_failures":self.failures,
+                "trips":self.trips, "last_error":self.last_error}
@@ -0,0 +1,33 @@
+import math
+import datetime as dt
+from collections import deque
+
+class ClockCorrelator:
+    """
+    Offset of the host clock from the instrument clock from a stream of
+    NTP style (offset, round trip delay) samples. As in the NTP clock
+    filter, of the last <window> samples the one with the shortest round
+    trip is taken as the estimate, since its offset is the least affected
+    by asymmetric delays; the jitter is the RMS difference of the other
+    offsets from it.
+    """
+    def __init__(self, table, window = 8, tags = None):
+        self.table = table
+        self.samples = deque(maxlen = window)
+        self.tags = tags or {'clock_id':'FS740'}
+
+    def update(self, offset, delay, host_time):
+        """
+        Add a sample taken at <host_time> (seconds since the epoch) and
+        return a one point list for <table>.
+        """
+        self.samples.append((delay, offset))
+        best_delay, best_offset = min(self.samples)
+        jitter = math.sqrt(sum((o - best_offset)**2 for _, o in self.samples)
+                           /len(self.samples))
+        time = dt.datetime.fromtimestamp(host_time, dt.timezone.utc)\
+                          .replace(tzinfo = None).isoformat()
+        return [{"measurement":self.table, "tags":self.tags, "time":time,
+                 "fields":{"offset":offset, "delay":delay,
+                           "filteredOffset":best_offset,
+                           "filteredDelay":best_delay, "jitter":jitter}}]
@@ -0,0 +1,137 @@
+import math
+from collections import deque
+
+from .history import epoch
+
+def _label(seconds):
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds % size == 0:
+            return '{0}{1}'.format(seconds//size, unit)
+    return '{0}s'.format(seconds)
+
+class DriftEstimator:
+    """
+    Streaming estimate of how the timebase would do in holdover, from the
+    time interval to GPS and the frequency control of every read.
+
+    A quadratic x(t) = a + b t + c t^2 is fitted to the time interval of
+    the last <window> seconds and a line to the frequency control, both
+    from running sums of powers of t that samples are added to and removed
+    from as they enter and leave the window, so an update costs O(1).
+    Times are taken relative to a reference that is moved forward, and
+    the sums recomputed, once per window to keep them well conditioned.
+
+    The fractional frequency offset is the slope of the fit at the latest
+    sample and the drift rate 2c. While locked, steering removes the drift
+    from the time interval, so with <efc_gain> (fractional frequency per
+    unit of frequency control) the drift is taken from the rate of change
+    of the frequency control instead. The predicted holdover time error
+    after T seconds is |y| T + |D| T^2/2. The fit restarts whenever the
+    timebase state changes.
+    """
+    def __init__(self, table, window = 3600.0, horizons = (3600, 86400),
+                 field = 'TBaseTInterval', efc_gain = None, min_samples = 10):
+        self.table = table
+        self.window = window
+        self.horizons = horizons
+        self.field = field
+        self.efc_gain = efc_gain
+        self.min_samples = min_samples
+        self.state = None
+        self.reset()
+
+    def reset(self, t_ref = 0.0):
+        self.samples = deque()
+        self.t_ref = t_ref
+        # sums of t^k for k = 0..4, of x t^k for k = 0..2, of f and f t
+        self.st = [0.0]*5
+        self.sx = [0.0]*3
+        self.sf = [0.0]*2
+
+    def accumulate(self, t, x, f, sign):
+        t -= self.t_ref
+        p = 1.0
+        for k in range(5):
+            self.st[k] += sign*p
+            if k < 3:
+                self.sx[k] += sign*x*p
+            if k < 2:
+                self.sf[k] += sign*f*p
+            p *= t
+
+    def add(self, t, x, f):
+        if not self.samples:
+            self.t_ref = t
+        elif t - self.t_ref > self.window:
+            # rebase on the oldest sample, amortized O(1)
+            samples = self.samples
+            self.reset(samples[0][0])
+            self.samples = samples
+            for sample in samples:
+                self.accumulate(*sample, 1)
+        self.samples.append((t, x, f))
+        self.accumulate(t, x, f, 1)
+        while self.samples[0][0] < t - self.window:
+            self.accumulate(*self.samples.popleft(), -1)
+
+    def fit(self):
+        """
+        (frequency offset, drift rate, frequency control rate) at the
+        latest sample, None while there are too few samples.
+        """
+        n = len(self.samples)
+        if n < max(self.min_samples, 3):
+            return None
+        s0, s1, s2, s3, s4 = self.st
+        x0, x1, x2 = self.sx
+        # normal equations of the quadratic, by Cramer's rule
+        det = s0*(s2*s4 - s3*s3) - s1*(s1*s4 - s3*s2) + s2*(s1*s3 - s2*s2)
+        if det == 0:
+            return None
+        b = (s0*(x1*s4 - s3*x2) - x0*(s1*s4 - s3*s2) + s2*(s1*x2 - x1*s2))/det
+        c = (s0*(s2*x2 - x1*s3) - s1*(s1*x2 - x1*s2) + x0*(s1*s3 - s2*s2))/det
+        t = self.samples[-1][0] - self.t_ref
+        frequency = b + 2*c*t
+        drift = 2*c
+        # line through the frequency control
+        f0, f1 = self.sf
+        var = s0*s2 - s1*s1
+        rate = (s0*f1 - s1*f0)/var if var else 0.0
+        if self.efc_gain is not None:
+            drift = self.efc_gain*rate
+        return frequency, drift, rate
+
+    def update(self, points):
+        """
+        Add the overview point among <points>, if any, and return the
+        estimate as a list of one point for <table>, or an empty list.
+        """
+        for point in points:
+            fields = point["fields"]
+            if self.field in fields and 'TBaseFControl' in fields:
+                break
+        else:
+            return []
+        state = fields.get('TBaseState', self.state)
+        if state != self.state:
+            self.state = state
+            self.reset()
+        x = fields[self.field]
+        f = fields['TBaseFControl']
+        if math.isnan(x) or math.isnan(f):
+            return []
+        self.add(epoch(point["time"]), x, f)
+
+        estimate = self.fit()
+        if estimate is None:
+            return []
+        frequency, drift, rate = estimate
+        out = {"frequencyOffset":frequency, "driftRate":drift,
+               "fcontrolRate":rate, "samples":len(self.samples),
+               "span":self.samples[-1][0] - self.samples[0][0]}
+        for horizon in self.horizons:
+            out["holdoverError" + _label(horizon)] = \
+                abs(frequency)*horizon + abs(drift)*horizon**2/2
+        return [{"measurement":self.table,
+                 "tags":dict(point["tags"], state = state),
+                 "time":point["time"], "fields":out}]
@@ -0,0 +1,63 @@
+import threading
+import datetime as dt
+from itertools import islice
+from collections import deque
+
+def epoch(time):
+    """
+    Seconds since the epoch of an ISO format UTC timestamp.
+    """
+    return dt.datetime.fromisoformat(time)\
+                      .replace(tzinfo = dt.timezone.utc).timestamp()
+
+class History:
+    """
+    Fixed size in-memory history of a recorder, fed from the points it
+    already produces so that displaying it costs no instrument I/O. Keeps
+    the last <maxlen> values of the overview <fields> and the satellites
+    tracked in the latest cycle.
+    """
+    def __init__(self, table, fields = ('TBaseTInterval', 'TBaseFControl'),
+                 maxlen = 3600):
+        self.overview, self.satellite_table = table.split(',')[:2]
+        self.fields = fields
+        self.times = deque(maxlen = maxlen)
+        self.values = dict((field, deque(maxlen = maxlen)) for field in fields)
+        self.satellites = []
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, points):
+        overview = None
+        satellites = []
+        for point in points:
+            if point["measurement"] == self.overview:
+                overview = point
+            elif point["measurement"] == self.satellite_table:
+                f = point["fields"]
+                satellites.append((point["tags"]["satelliteID"], f["signal"],
+                                   f["elevation"], f["azimuth"]))
+        if overview is None:
+            return
+        t = epoch(overview["time"])
+        with self.lock:
+            self.times.append(t)
+            for field in self.fields:
+                self.values[field].append(
+                    overview["fields"].get(field, float('nan')))
+            self.satellites = satellites
+            self.count += 1
+
+    def since(self, count):
+        """
+        Return the samples appended after the <count>th as
+        (count, times, {field: values}, satellites), where the returned
+        count is to be passed to the next call.
+        """
+        with self.lock:
+            n = min(self.count - count, len(self.times))
+            start = len(self.times) - n
+            times = list(islice(self.times, start, None))
+            values = dict((field, list(islice(self.values[field], start, None)))
+                          for field in self.fields)
+            return self.count, times, values, list(self.satellites)
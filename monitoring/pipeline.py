@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+class PointQueue:
+    """
+    Bounded queue of point batches between the acquisition and the writer
+    stage of a recorder. What happens when the writer falls behind and the
+    queue is full is set by the backpressure policy:
+
+    policy      : behaviour
+    block       : put() waits until the writer frees a slot
+    drop-oldest : the oldest queued batch is discarded
+    spill       : batches go to json segment files in <spill_dir> and are
+                  read back in order once the writer catches up
+    """
+    POLICIES = ('block', 'drop-oldest', 'spill')
+
+    def __init__(self, maxsize = 100, policy = 'block', spill_dir = None):
+        assert policy in self.POLICIES, 'policy invalid value'
+        assert maxsize >= 1, 'maxsize out of range'
+        if policy == 'spill':
+            assert spill_dir, 'spill policy requires spill_dir'
+            os.makedirs(spill_dir, exist_ok = True)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self.batches = deque()
+        self.cond = threading.Condition()
+
+        # spill segments, oldest first, each holding up to maxsize batches
+        self.segments = deque()
+        self.segment_count = 0
+        self.segment_seq = 0
+        if policy == 'spill':
+            self.resume()
+
+        # metrics
+        self.max_depth = 0
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.blocked_time = 0.0
+
+    def __len__(self):
+        with self.cond:
+            return len(self.batches) + self.spill_depth()
+
+    def spill_depth(self):
+        return (len(self.segments)-1)*self.maxsize + self.segment_count \
+               if self.segments else 0
+
+    def put(self, batch, timeout = None):
+        """
+        Queue a batch of points. Returns False if the block policy timed
+        out waiting for a free slot, otherwise True.
+        """
+        with self.cond:
+            self.put_count += 1
+            if self.policy == 'spill' and \
+               (self.segments or len(self.batches) >= self.maxsize):
+                self.spill(batch)
+            else:
+                if len(self.batches) >= self.maxsize:
+                    if self.policy == 'drop-oldest':
+                        self.batches.popleft()
+                        self.dropped += 1
+                    else:
+                        t0 = time.monotonic()
+                        ok = self.cond.wait_for(
+                            lambda: len(self.batches) < self.maxsize, timeout)
+                        self.blocked_time += time.monotonic() - t0
+                        if not ok:
+                            self.dropped += 1
+                            return False
+                self.batches.append(batch)
+            self.max_depth = max(self.max_depth,
+                                 len(self.batches) + self.spill_depth())
+            self.cond.notify_all()
+            return True
+
+    def get(self, timeout = None):
+        """
+        Return the oldest batch, or None if nothing arrived within
+        <timeout> seconds.
+        """
+        with self.cond:
+            if not self.batches and self.segments:
+                self.unspill()
+            if not self.cond.wait_for(lambda: self.batches, timeout):
+                return None
+            batch = self.batches.popleft()
+            self.get_count += 1
+            self.cond.notify_all()
+            return batch
+
+    def resume(self):
+        """
+        Pick up segments left behind by a previous run so that they are
+        written before any new batch.
+        """
+        fnames = sorted(f for f in os.listdir(self.spill_dir)
+                        if f.endswith('.jsonl'))
+        for fname in fnames:
+            self.segments.append(os.path.join(self.spill_dir, fname))
+        if fnames:
+            self.segment_seq = int(fnames[-1].split('.')[0])
+            with open(self.segments[-1]) as f:
+                self.segment_count = sum(1 for line in f)
+
+    def spill(self, batch):
+        if not self.segments or self.segment_count >= self.maxsize:
+            self.segment_seq += 1
+            self.segments.append(os.path.join(self.spill_dir,
+                                 '{0:08d}.jsonl'.format(self.segment_seq)))
+            self.segment_count = 0
+        with open(self.segments[-1], 'a') as f:
+            f.write(json.dumps(batch) + '\n')
+        self.segment_count += 1
+        self.spilled += 1
+
+    def unspill(self):
+        fname = self.segments.popleft()
+        with open(fname) as f:
+            self.batches.extend(json.loads(line) for line in f)
+        os.remove(fname)
+        if not self.segments:
+            self.segment_count = 0
+
+    def metrics(self):
+        with self.cond:
+            return {"depth":len(self.batches) + self.spill_depth(),
+                    "max_depth":self.max_depth,
+                    "put":self.put_count,
+                    "dequeued":self.get_count,
+                    "dropped":self.dropped,
+                    "spilled":self.spilled,
+                    "blocked_time":round(self.blocked_time, 3)}
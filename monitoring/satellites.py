@@ -0,0 +1,168 @@
+import os
+import threading
+import numpy as np
+
+from .history import epoch
+
+class SatelliteStore:
+    """
+    Elevation, azimuth and SNR of the satellites tracked in the last <size>
+    cycles, kept in preallocated ring arrays of shape (size, channels) with
+    one column per receiver channel; unused channels have id 0.
+
+    Instead of one series per satellite in InfluxDB this answers coverage
+    questions (visibility windows, SNR against elevation, sky coverage)
+    with a few vectorized operations, and can flush itself periodically
+    as compressed columnar .npz blobs. The recorder appends while the GUI
+    queries, the queries work on a copy taken under the lock.
+    """
+    def __init__(self, size = 86400, channels = 20, flush_dir = None,
+                 flush_every = 3600):
+        self.size = size
+        self.channels = channels
+        self.time = np.zeros(size, np.float64)
+        self.ids = np.zeros((size, channels), np.uint8)
+        self.signal = np.zeros((size, channels), np.uint8)
+        self.elevation = np.zeros((size, channels), np.int8)
+        self.azimuth = np.zeros((size, channels), np.int16)
+        self.index = 0
+        self.count = 0
+        self.flush_dir = flush_dir
+        # a flush has to come before the ring overwrites unflushed cycles
+        self.flush_every = min(flush_every, size)
+        self.unflushed = 0
+        self.lock = threading.Lock()
+        if flush_dir:
+            os.makedirs(flush_dir, exist_ok = True)
+
+    def append(self, time, satellites):
+        """
+        Add a cycle at epoch <time> with the (id, signal, elevation,
+        azimuth) of its tracked satellites.
+        """
+        n = min(len(satellites), self.channels)
+        with self.lock:
+            i = self.index
+            self.time[i] = time
+            self.ids[i] = 0
+            if n:
+                ids, signal, elevation, azimuth = zip(*satellites[:n])
+                self.ids[i, :n] = ids
+                self.signal[i, :n] = signal
+                self.elevation[i, :n] = elevation
+                self.azimuth[i, :n] = azimuth
+            self.index = (i + 1) % self.size
+            self.count = min(self.count + 1, self.size)
+            self.unflushed += 1
+            due = self.flush_dir and self.unflushed >= self.flush_every
+        if due:
+            self.flush()
+
+    def append_points(self, points, table):
+        """
+        Add a cycle from the recorder points of the satellites <table>. A
+        full read with no satellite in view adds an empty cycle, so that
+        visibility windows end at an outage.
+        """
+        satellites = [p for p in points if p["measurement"] == table]
+        if satellites:
+            self.append(epoch(satellites[0]["time"]),
+                        [(p["tags"]["satelliteID"], p["fields"]["signal"],
+                          p["fields"]["elevation"], p["fields"]["azimuth"])
+                         for p in satellites])
+            return
+        for p in points:
+            if p["fields"].get("satelitesConnected") == 0:
+                self.append(epoch(p["time"]), [])
+                return
+
+    def order(self, last = None):
+        """
+        Ring indices of the stored cycles, oldest first, optionally only
+        the <last> ones.
+        """
+        n = self.count if last is None else min(last, self.count)
+        return (np.arange(self.index - n, self.index)) % self.size
+
+    def columns(self, last = None):
+        """
+        Copies of the stored cycles, oldest first, optionally only the
+        <last> ones.
+        """
+        with self.lock:
+            return self.take(self.order(last))
+
+    def take(self, idx):
+        return {"time":self.time[idx], "ids":self.ids[idx],
+                "signal":self.signal[idx], "elevation":self.elevation[idx],
+                "azimuth":self.azimuth[idx]}
+
+    def visibility(self, satellite, min_elevation = 0):
+        """
+        List of (start, end) epoch times during which <satellite> was
+        tracked above <min_elevation> degrees.
+        """
+        c = self.columns()
+        seen = ((c["ids"] == satellite) &
+                (c["elevation"] >= min_elevation)).any(axis = 1)
+        edges = np.diff(np.concatenate(([0], seen.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        t = c["time"]
+        return list(zip(t[starts].tolist(), t[ends].tolist()))
+
+    def snr_vs_elevation(self, bins = 9):
+        """
+        Mean, standard deviation and number of SNR observations in
+        <bins> equal elevation bins from 0 to 90 degrees.
+        Returns (bin edges, mean, std, count).
+        """
+        c = self.columns()
+        valid = c["ids"] != 0
+        elevation = c["elevation"][valid]
+        signal = c["signal"][valid].astype(np.float64)
+        edges = np.linspace(0, 90, bins + 1)
+        count, _ = np.histogram(elevation, edges)
+        total, _ = np.histogram(elevation, edges, weights = signal)
+        squares, _ = np.histogram(elevation, edges, weights = signal**2)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            mean = total/count
+            std = np.sqrt(np.maximum(squares/count - mean**2, 0))
+        return edges, mean, std, count
+
+    def sky_coverage(self, azimuth_bins = 36, elevation_bins = 9,
+                     weights = None):
+        """
+        Number of observations per (azimuth, elevation) cell, or the mean
+        SNR per cell with weights = 'signal'.
+        Returns (azimuth edges, elevation edges, map).
+        """
+        c = self.columns()
+        valid = c["ids"] != 0
+        azimuth = c["azimuth"][valid]
+        elevation = c["elevation"][valid]
+        az_edges = np.linspace(0, 360, azimuth_bins + 1)
+        el_edges = np.linspace(0, 90, elevation_bins + 1)
+        count, _, _ = np.histogram2d(azimuth, elevation, (az_edges, el_edges))
+        if weights != 'signal':
+            return az_edges, el_edges, count
+        signal = c["signal"][valid].astype(np.float64)
+        total, _, _ = np.histogram2d(azimuth, elevation, (az_edges, el_edges),
+                                     weights = signal)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return az_edges, el_edges, total/count
+
+    def flush(self):
+        """
+        Write the cycles added since the last flush to
+        <flush_dir>/satellites_<first epoch>.npz, one array per column.
+        """
+        with self.lock:
+            if not self.unflushed:
+                return None
+            columns = self.take(self.order(min(self.unflushed, self.count)))
+            self.unflushed = 0
+        fname = os.path.join(self.flush_dir,
+                             'satellites_{0:.0f}.npz'.format(columns["time"][0]))
+        np.savez_compressed(fname, **columns)
+        return fname
@@ -0,0 +1,344 @@
+import os
+import json
+import math
+import struct
+import bisect
+import threading
+from array import array
+
+from .history import epoch
+
+class BitWriter:
+    def __init__(self):
+        self.data = bytearray()
+        self.acc = 0
+        self.bits = 0
+
+    def write(self, value, n):
+        self.acc = (self.acc << n) | (value & ((1 << n) - 1))
+        self.bits += n
+        while self.bits >= 8:
+            self.bits -= 8
+            self.data.append((self.acc >> self.bits) & 0xff)
+        self.acc &= (1 << self.bits) - 1
+
+    def getvalue(self):
+        if self.bits:
+            return bytes(self.data) + bytes([(self.acc << (8 - self.bits)) & 0xff])
+        return bytes(self.data)
+
+class BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, n):
+        start = self.pos >> 3
+        end = (self.pos + n + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], 'big')
+        shift = (end << 3) - self.pos - n
+        self.pos += n
+        return (chunk >> shift) & ((1 << n) - 1)
+
+def _signed(value, n):
+    return value - (1 << n) if value >> (n - 1) else value
+
+# delta-of-delta buckets of the timestamps, in microseconds: control bits
+# and their count, and the width of the value that follows; a zero is a
+# single 0 bit and anything larger than the last bucket takes 64 bits
+DOD_BUCKETS = ((0b10, 2, 12), (0b110, 3, 20), (0b1110, 4, 32))
+
+def encode_times(times):
+    """
+    Pack integer microsecond timestamps as delta-of-deltas, which is a
+    single bit per sample at a steady rate.
+    """
+    out = BitWriter()
+    previous, delta = times[0], 0
+    out.write(previous, 64)
+    for t in times[1:]:
+        dod = t - previous - delta
+        delta = t - previous
+        previous = t
+        if dod == 0:
+            out.write(0, 1)
+            continue
+        for control, n, bits in DOD_BUCKETS:
+            if -(1 << (bits - 1)) <= dod < (1 << (bits - 1)):
+                out.write(control, n)
+                out.write(dod, bits)
+                break
+        else:
+            out.write(0b1111, 4)
+            out.write(dod, 64)
+    return out.getvalue()
+
+def decode_times(data, count):
+    bits = BitReader(data)
+    t = _signed(bits.read(64), 64)
+    times = [t]
+    delta = 0
+    for i in range(count - 1):
+        if not bits.read(1):
+            dod = 0
+        elif not bits.read(1):
+            dod = _signed(bits.read(12), 12)
+        elif not bits.read(1):
+            dod = _signed(bits.read(20), 20)
+        elif not bits.read(1):
+            dod = _signed(bits.read(32), 32)
+        else:
+            dod = _signed(bits.read(64), 64)
+        delta += dod
+        t += delta
+        times.append(t)
+    return times
+
+def encode_values(values):
+    """
+    Pack floats as the XOR with the previous value, storing only its
+    meaningful bits, and reusing the previous window of leading and
+    trailing zeros when they fit: a repeated value is a single bit.
+    """
+    words = array('Q')
+    words.frombytes(array('d', values).tobytes())
+    out = BitWriter()
+    previous = words[0]
+    out.write(previous, 64)
+    lead, trail = 65, 0
+    for word in words[1:]:
+        xor = word ^ previous
+        previous = word
+        if xor == 0:
+            out.write(0, 1)
+            continue
+        out.write(1, 1)
+        l = min(64 - xor.bit_length(), 31)
+        t = (xor & -xor).bit_length() - 1
+        if l >= lead and t >= trail:
+            out.write(0, 1)
+            out.write(xor >> trail, 64 - lead - trail)
+        else:
+            lead, trail = l, t
+            size = 64 - lead - trail
+            out.write(1, 1)
+            out.write(lead, 5)
+            out.write(size - 1, 6)
+            out.write(xor >> trail, size)
+    return out.getvalue()
+
+def decode_values(data, count):
+    bits = BitReader(data)
+    word = bits.read(64)
+    words = array('Q', [word])
+    lead = trail = 0
+    for i in range(count - 1):
+        if bits.read(1):
+            if bits.read(1):
+                lead = bits.read(5)
+                trail = 64 - lead - bits.read(6) - 1
+            word ^= bits.read(64 - lead - trail) << trail
+        words.append(word)
+    values = array('d')
+    values.frombytes(words.tobytes())
+    return values.tolist()
+
+class SeriesStore:
+    """
+    Compact on-disk store of numeric overview fields, for months of 1 Hz
+    data per clock. Samples are gathered into blocks of <block_size>,
+    which are compressed as delta-of-delta timestamps (microseconds) and
+    XOR encoded values per field, appended to <path>/blocks, and listed
+    with their time span in <path>/index. A time range read decompresses
+    only the blocks and fields it needs.
+
+    Samples are expected in time order. The block being filled is kept
+    in memory and written once it spans <max_age> seconds, so that a crash
+    loses at most that much, and by flush() and close(). Opening a store
+    cuts what a crash left at the end of the index.
+    """
+    INDEX = struct.Struct('<qqQII')
+
+    def __init__(self, path, fields = ('TBaseTInterval', 'TBaseFControl'),
+                 block_size = 3600, max_age = 300.0):
+        self.path = path
+        os.makedirs(path, exist_ok = True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if list(fields) != meta["fields"]:
+                raise ValueError('{0} holds fields {1}, not {2}'
+                                 .format(path, meta["fields"], list(fields)))
+            block_size = meta["block_size"]
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({"fields":list(fields), "block_size":block_size}, f)
+        self.fields = tuple(fields)
+        self.block_size = block_size
+        self.max_age = max_age
+        self.blocks_path = os.path.join(path, 'blocks')
+        self.index_path = os.path.join(path, 'index')
+        # (first, last, offset, length, count) of each block on disk
+        self.index = []
+        self.lasts = []
+        self.index_size = 0
+        self.times = []
+        self.columns = [[] for field in self.fields]
+        self.lock = threading.Lock()
+        self.repair()
+        self.load_index()
+
+    def repair(self):
+        """
+        Truncate the index to its complete records, dropping the trailing
+        entries of blocks that were not completely written, so that the
+        entries appended next are aligned and valid.
+        """
+        if not os.path.exists(self.index_path):
+            return
+        size = os.path.getsize(self.blocks_path) \
+               if os.path.exists(self.blocks_path) else 0
+        with open(self.index_path, 'r+b') as f:
+            data = f.read()
+            n = len(data)//self.INDEX.size
+            while n:
+                entry = self.INDEX.unpack_from(data, (n - 1)*self.INDEX.size)
+                if entry[2] + entry[3] <= size:
+                    break
+                n -= 1
+            if n*self.INDEX.size != len(data):
+                f.truncate(n*self.INDEX.size)
+
+    def load_index(self):
+        """
+        Read the block index, also picking up blocks another process has
+        written since.
+        """
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        size = os.path.getsize(self.blocks_path)
+        n = len(data)//self.INDEX.size
+        # entries of a block cut short by a crash are left out
+        self.index = [entry for entry in
+                      (self.INDEX.unpack_from(data, i*self.INDEX.size)
+                       for i in range(n))
+                      if entry[2] + entry[3] <= size]
+        self.lasts = [entry[1] for entry in self.index]
+        self.index_size = len(data)
+
+    def append(self, time, values):
+        """
+        Add a sample at epoch <time> with {field: value}; missing fields
+        are stored as NaN.
+        """
+        with self.lock:
+            self.times.append(int(round(time*1e6)))
+            for column, field in zip(self.columns, self.fields):
+                column.append(float(values.get(field, math.nan)))
+            if len(self.times) >= self.block_size or \
+               self.times[-1] - self.times[0] >= self.max_age*1e6:
+                self.write_block()
+
+    def append_points(self, points, table):
+        """
+        Add the sample of the recorder point for the overview <table>.
+        """
+        for point in points:
+            if point["measurement"] == table:
+                values = dict((field, value) for field, value
+                              in point["fields"].items()
+                              if isinstance(value, (int, float)))
+                self.append(epoch(point["time"]), values)
+
+    def write_block(self):
+        if not self.times:
+            return
+        parts = [encode_times(self.times)]
+        parts += [encode_values(column) for column in self.columns]
+        block = struct.pack('<I', len(self.times)) + b''.join(
+            struct.pack('<I', len(part)) + part for part in parts)
+        with open(self.blocks_path, 'ab') as f:
+            offset = f.tell()
+            f.write(block)
+        with open(self.index_path, 'ab') as f:
+            entry = (self.times[0], self.times[-1], offset, len(block),
+                     len(self.times))
+            f.write(self.INDEX.pack(*entry))
+        self.index.append(entry)
+        self.lasts.append(entry[1])
+        self.index_size += self.INDEX.size
+        self.times = []
+        self.columns = [[] for field in self.fields]
+
+    def flush(self):
+        """
+        Write the samples of the block being filled as a shorter block.
+        """
+        with self.lock:
+            self.write_block()
+
+    def close(self):
+        self.flush()
+
+    def decode(self, block, columns):
+        count = struct.unpack_from('<I', block)[0]
+        parts = []
+        pos = 4
+        for i in range(len(self.fields) + 1):
+            n = struct.unpack_from('<I', block, pos)[0]
+            parts.append(block[pos + 4:pos + 4 + n])
+            pos += 4 + n
+        times = decode_times(parts[0], count)
+        return times, [decode_values(parts[i + 1], count) for i in columns]
+
+    def read(self, start = None, end = None, fields = None):
+        """
+        Times (epoch seconds) and {field: values} of the samples with
+        start <= time < end, of all fields by default.
+        """
+        fields = self.fields if fields is None else tuple(fields)
+        columns = [self.fields.index(field) for field in fields]
+        lo = -2**63 if start is None else int(round(start*1e6))
+        hi = 2**63 - 1 if end is None else int(round(end*1e6))
+        with self.lock:
+            if os.path.exists(self.index_path) and \
+               os.path.getsize(self.index_path) != self.index_size:
+                self.load_index()
+            first = bisect.bisect_left(self.lasts, lo)
+            blocks = []
+            for entry in self.index[first:]:
+                if entry[0] >= hi:
+                    break
+                blocks.append(entry)
+            pending = (list(self.times), [list(self.columns[i]) for i in columns])
+
+        times = []
+        values = [[] for i in columns]
+        decoded = []
+        if blocks:
+            with open(self.blocks_path, 'rb') as f:
+                for first_time, last_time, offset, length, count in blocks:
+                    f.seek(offset)
+                    decoded.append(self.decode(f.read(length), columns))
+        decoded.append(pending)
+        for block_times, block_values in decoded:
+            i = bisect.bisect_left(block_times, lo)
+            j = bisect.bisect_left(block_times, hi)
+            times += [t/1e6 for t in block_times[i:j]]
+            for column, block_column in zip(values, block_values):
+                column += block_column[i:j]
+        return times, dict(zip(fields, values))
+
+    def stats(self):
+        with self.lock:
+            samples = sum(entry[4] for entry in self.index)
+            stored = sum(entry[3] for entry in self.index)
+            pending = len(self.times)
+        raw = 8*(1 + len(self.fields))*samples
+        return {"samples":samples + pending, "blocks":len(self.index),
+                "bytes":stored,
+                "bytes_per_sample":stored/samples if samples else 0.0,
+                "ratio":raw/stored if stored else 0.0}
@@ -0,0 +1,173 @@
+import os
+import gzip
+import json
+import time
+import threading
+import datetime as dt
+
+from .trace import tracer
+
+class InfluxDBSink:
+    """
+    Writes points to an InfluxDB database over HTTP.
+    """
+    def __init__(self, host, port = 8086, database = None, user = None,
+                 password = None):
+        self.host = host
+        self.port = int(port)
+        self.database = database
+        self.user = user
+        self.password = password
+        self.client = None
+
+    def open(self):
+        # influxdb is slow to import and only needed once recording starts
+        from influxdb import InfluxDBClient
+        self.client = InfluxDBClient(host = self.host, port = self.port,
+                                     username = self.user,
+                                     password = self.password)
+        self.client.switch_database(self.database)
+
+    def write(self, points):
+        self.client.write_points(points)
+
+    # client errors that are worth retrying: timeouts, rate limits, and
+    # settings the operator can correct (credentials, a missing database)
+    RETRIED_CODES = (401, 403, 404, 408, 429)
+
+    def permanent(self, error):
+        """
+        True if the server rejected the points themselves, e.g. a 400 for
+        a field type conflict, so that writing them again cannot succeed.
+        """
+        code = getattr(error, 'code', None)
+        return isinstance(code, int) and 400 <= code < 500 and \
+               code not in self.RETRIED_CODES
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+
+class FileSink:
+    """
+    Archives points as JSON lines in one gzip file per UTC day,
+    <path>/YYYY-MM-DD.jsonl.gz, appending a gzip member per write.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        os.makedirs(self.path, exist_ok = True)
+
+    def write(self, points):
+        fname = os.path.join(self.path, '{0}.jsonl.gz'.format(
+                             dt.datetime.now(dt.timezone.utc).date().isoformat()))
+        data = ''.join(json.dumps(point) + '\n' for point in points)
+        with gzip.open(fname, 'at', encoding = 'utf8') as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+SINK_TYPES = {'influxdb':InfluxDBSink, 'file':FileSink}
+
+def make_sink(settings):
+    """
+    Sink from a settings dict, the 'type' key selecting the class of
+    SINK_TYPES and the other keys its arguments.
+    """
+    settings = dict(settings)
+    return SINK_TYPES[settings.pop('type', 'influxdb')](**settings)
+
+class SinkWriter(threading.Thread):
+    """
+    Writes the batches of a PointQueue to a sink until recording stops and
+    the queue is drained. Batches that queued up while a write was in
+    progress are merged into writes of up to <max_batch> points. A failed
+    write is kept and retried every second while recording, unless the
+    sink reports the error as permanent (sink.permanent(error)); such a
+    batch is dropped and counted as rejected.
+    """
+    def __init__(self, sink, queue, active, watchdog = None, max_batch = 5000):
+        threading.Thread.__init__(self)
+        self.sink = sink
+        self.queue = queue
+        self.active = active
+        self.watchdog = watchdog
+        self.max_batch = max_batch
+        # set when a replacement took over from this writer
+        self.retired = threading.Event()
+        self.failures = 0
+        self.rejected = 0
+        self.last_rejection = None
+        self.last_latency = 0.0
+        self.writes = 0
+        self.written = 0
+        self.write_time = 0.0
+        self.started = None
+
+    def next_batch(self):
+        batch = self.queue.get(timeout = 1)
+        if batch is None:
+            return None
+        # the queued lists are shared with the other sinks, merge into a
+        # new one
+        merged = None
+        while len(merged or batch) < self.max_batch:
+            more = self.queue.get(timeout = 0)
+            if more is None:
+                break
+            merged = (merged or list(batch)) + more
+        return merged or batch
+
+    # write batches until recording stops and the queue is drained
+    def run(self):
+        self.started = time.monotonic()
+        self.sink.open()
+        try:
+            batch = None
+            while not self.retired.is_set() and \
+                  (self.active.is_set() or len(self.queue) or batch):
+                if self.watchdog:
+                    self.watchdog.beat(time.monotonic(), 1)
+                if batch is None:
+                    batch = self.next_batch()
+                    if batch is None:
+                        continue
+                try:
+                    t0 = time.monotonic()
+                    with tracer.span('write', root = True, points = len(batch),
+                                     sink = type(self.sink).__name__):
+                        self.sink.write(batch)
+                    self.last_latency = time.monotonic() - t0
+                    self.write_time += self.last_latency
+                    self.writes += 1
+                    self.written += len(batch)
+                    batch = None
+                except Exception as e:
+                    self.failures += 1
+                    if getattr(self.sink, 'permanent', lambda e: False)(e):
+                        self.rejected += len(batch)
+                        self.last_rejection = repr(e)
+                        batch = None
+                        continue
+                    # keep the batch and retry while recording, otherwise
+                    # give up on what is left
+                    if not self.active.is_set():
+                        break
+                    time.sleep(1)
+            if batch and self.retired.is_set():
+                # hand the batch to the replacement
+                self.queue.put(batch)
+        finally:
+            self.sink.close()
+
+    def metrics(self):
+        elapsed = time.monotonic() - self.started if self.started else 0
+        return {"written":self.written, "writes":self.writes,
+                "failures":self.failures, "rejected":self.rejected,
+                "last_rejection":self.last_rejection,
+                "throughput":round(self.written/elapsed, 1) if elapsed else 0.0,
+                "latency":round(self.last_latency, 3),
+                "mean_latency":round(self.write_time/self.writes, 3)
+                               if self.writes else 0.0}
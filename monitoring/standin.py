@@ -0,0 +1,98 @@
+"""
+Local stand-in for an InfluxDB 1.x server, enough for the influxdb client
+to ping, select a database and write, for trying out sinks without a
+database:
+
+    python -m monitoring.standin --port 8087 --delay 0.5
+
+It counts the points written to each database and can be made slow
+(--delay seconds per write) or unreliable (--fail fraction of writes
+answered with an error) to see how the other sinks and the acquisition
+cope.
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class InfluxStandIn(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay = 0.0, fail = 0.0):
+        ThreadingHTTPServer.__init__(self, address, StandInHandler)
+        self.delay = delay
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.points = {}
+        self.writes = 0
+        self.errors = 0
+
+    def stats(self):
+        with self.lock:
+            return {"writes":self.writes, "errors":self.errors,
+                    "points":dict(self.points)}
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def reply(self, code, body = None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Influxdb-Version', '1.8-standin')
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/ping':
+            self.reply(204)
+        elif path == '/query':
+            self.reply(200, {"results":[{"statement_id":0}]})
+        else:
+            self.reply(404, {"error":"not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if url.path == '/query':
+            self.reply(200, {"results":[{"statement_id":0}]})
+            return
+        if url.path != '/write':
+            self.reply(404, {"error":"not found"})
+            return
+        server = self.server
+        if server.delay:
+            time.sleep(server.delay)
+        if random.random() < server.fail:
+            with server.lock:
+                server.errors += 1
+            self.reply(500, {"error":"stand-in failure"})
+            return
+        db = parse_qs(url.query).get('db', [''])[0]
+        n = sum(1 for line in body.split(b'\n') if line.strip())
+        with server.lock:
+            server.writes += 1
+            server.points[db] = server.points.get(db, 0) + n
+        self.reply(204)
+
+def main():
+    parser = argparse.ArgumentParser(description = 'InfluxDB stand-in for testing sinks.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8087)
+    parser.add_argument('--delay', type = float, default = 0.0)
+    parser.add_argument('--fail', type = float, default = 0.0)
+    args = parser.parse_args()
+    with InfluxStandIn((args.host, args.port), args.delay, args.fail) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(server.stats())
+
+if __name__ == "__main__":
+    main()
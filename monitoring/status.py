@@ -0,0 +1,54 @@
+class StatusEngine:
+    """
+    Keeps the last seen value of each status condition register and turns
+    the bits that changed between polls into rising/falling edge points
+    for the log measurement. Bits latched in an event register that rose
+    and fell again between two polls are reported as transient.
+    """
+    def __init__(self, table, device_id = 'FS740'):
+        self.table = table
+        self.device_id = device_id
+        self.conditions = {}
+        self.events = {}
+
+    def point(self, time, register, edge, flag):
+        return {"measurement":self.table,
+                "tags":{"deviceID":self.device_id, "label":"status",
+                        "register":register, "edge":edge},
+                "time":time, "fields":{"message":flag}}
+
+    def edges(self, time, register, names, mask, edge):
+        points = []
+        i = 0
+        while mask:
+            if mask & 1:
+                points.append(self.point(time, register, edge, names[i]))
+            mask >>= 1
+            i += 1
+        return points
+
+    def update(self, device):
+        """
+        Poll the status registers of <device> and return the list of edge
+        points, empty if nothing changed since the previous call.
+        """
+        date, time, conditions, events = device.ReadStatusRegisters()
+        time = device.ParseTimestamp(date, time)
+
+        points = []
+        for register, condition in conditions.items():
+            names = device.STATUS_BIT_NAMES[register]
+            previous = self.conditions.get(register, 0)
+            event = events[register]
+            if register in device.STATUS_LATCHED:
+                event, self.events[register] = \
+                    event & ~self.events.get(register, 0), event
+            changed = previous ^ condition
+            points += self.edges(time, register, names, changed & condition,
+                                 'rising')
+            points += self.edges(time, register, names, changed & previous,
+                                 'falling')
+            points += self.edges(time, register, names,
+                                 event & ~condition & ~previous, 'transient')
+            self.conditions[register] = condition
+        return points
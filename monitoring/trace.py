@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import random
+import threading
+
+class Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'root', 'sampled', 'ts', 't0')
+
+    def __init__(self, tracer, name, cat, args, root, sampled = True):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.root = root
+        self.sampled = sampled
+
+    def __enter__(self):
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self.sampled:
+            dur = time.perf_counter() - self.t0
+            if exc[0] is not None:
+                self.args["error"] = repr(exc[1])
+            self.tracer.add({"name":self.name, "cat":self.cat, "ph":"X",
+                             "ts":self.ts*1e6, "dur":dur*1e6, "args":self.args})
+        if self.root:
+            self.tracer.local.sampled = None
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    """
+    Collects spans of the recorder (cycles, instrument queries, parsing,
+    database writes) as Chrome trace events, for chrome://tracing or
+    https://ui.perfetto.dev. Each thread gets its own track, named after
+    the thread, within a track per process.
+
+    Tracing is meant to be switched on for a few minutes at a time:
+    start() records for <duration> seconds and writes the trace to <path>
+    when it ends, from a timer thread, or on stop(). Only a <sample> fraction of the root spans
+    (a read cycle, a database write) is kept, with all spans inside them,
+    and at most <max_events> events. Spans are a shared no-op while
+    tracing is off.
+    """
+    def __init__(self):
+        self.active = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.events = []
+        self.threads = set()
+        self.settings = None
+        self.timer = None
+        # name of the track of this process
+        self.process_name = 'recorder'
+
+    def start(self, path, duration = 300.0, sample = 1.0, max_events = 1000000):
+        with self.lock:
+            self.settings = {"path":path, "duration":duration,
+                             "sample":sample, "max_events":max_events}
+            self.path = path
+            self.deadline = time.monotonic() + duration
+            self.sample = sample
+            self.max_events = max_events
+            self.events = []
+            self.threads = set()
+            self.dropped = 0
+            self.local = threading.local()
+            self.active = True
+            if self.timer is not None:
+                self.timer.cancel()
+            # the file is written off the traced threads
+            self.timer = threading.Timer(duration, self.stop)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def stop(self):
+        """
+        Stop tracing and write the trace file, returning its path.
+        """
+        with self.lock:
+            if not self.active:
+                return None
+            self.active = False
+            if self.timer is not threading.current_thread():
+                self.timer.cancel()
+            events, self.events = self.events, []
+        with open(self.path, 'w') as f:
+            json.dump({"traceEvents":events, "displayTimeUnit":"ms",
+                       "otherData":{"dropped":self.dropped}}, f)
+        return self.path
+
+    def handover(self):
+        """
+        Settings for tracing the rest of the current trace in a worker
+        process, None while not tracing.
+        """
+        if not self.active:
+            return None
+        return dict(self.settings,
+                    duration = max(0.0, self.deadline - time.monotonic()))
+
+    def instant(self, name, cat = 'recorder', **args):
+        """
+        Mark an event without duration, e.g. a restart, on the track of
+        the calling thread.
+        """
+        if self.active:
+            self.add({"name":name, "cat":cat, "ph":"i", "s":"t",
+                      "ts":time.time()*1e6, "args":args})
+
+    def span(self, name, cat = 'recorder', root = False, **args):
+        """
+        Context manager timing the block it wraps. A <root> span decides
+        whether the spans nested in it on the same thread are sampled.
+        """
+        if not self.active:
+            return NULL_SPAN
+        if time.monotonic() > self.deadline:
+            # the timer is about to write the file
+            return NULL_SPAN
+        if root:
+            self.local.sampled = random.random() < self.sample
+            return Span(self, name, cat, args, root, self.local.sampled)
+        sampled = getattr(self.local, 'sampled', None)
+        if sampled is None:
+            sampled = random.random() < self.sample
+        if not sampled:
+            return NULL_SPAN
+        return Span(self, name, cat, args, root)
+
+    def add(self, event):
+        pid = os.getpid()
+        thread = threading.current_thread()
+        event["pid"] = pid
+        event["tid"] = thread.ident
+        with self.lock:
+            if not self.active:
+                return
+            if len(self.events) >= self.max_events:
+                self.dropped += 1
+                return
+            if pid not in self.threads:
+                self.threads.add(pid)
+                self.events.append({"name":"process_name", "ph":"M", "pid":pid,
+                                    "args":{"name":self.process_name}})
+            if (pid, thread.ident) not in self.threads:
+                self.threads.add((pid, thread.ident))
+                self.events.append({"name":"thread_name", "ph":"M", "pid":pid,
+                                    "tid":thread.ident,
+                                    "args":{"name":thread.name}})
+            self.events.append(event)
+
+# the tracer of this process
+tracer = Tracer()
@@ -0,0 +1,83 @@
+import threading
+
+class Watchdog:
+    """
+    Tracks the progress of a worker thread. The worker calls beat() after
+    every cycle, passing how long it expects to sleep before the next
+    one; if no beat arrives within <timeout> seconds of that, check()
+    reports a stall. A stall is timed from the moment the cycle was due
+    until the next beat.
+    """
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.last_beat = None
+        self.deadline = None
+        # start of a wait that does not count as a stall, see hold()
+        self.held = None
+        self.stalled_since = None
+        self.stalls = 0
+        self.restarts = 0
+        self.longest_stall = 0.0
+        self.total_stall = 0.0
+        self.lock = threading.Lock()
+
+    def beat(self, now, next_due = 0.0):
+        """
+        Progress at monotonic time <now>, the next expected <next_due>
+        seconds later.
+        """
+        with self.lock:
+            self.last_beat = now
+            self.deadline = now + next_due + self.timeout
+            if self.stalled_since is not None:
+                duration = now - self.stalled_since
+                self.longest_stall = max(self.longest_stall, duration)
+                self.total_stall += duration
+                self.stalled_since = None
+
+    def hold(self, now):
+        """
+        Stop the clock while the worker waits on something other than
+        its own work, e.g. a full queue; resume() restarts it, moving the
+        deadline by the time held.
+        """
+        with self.lock:
+            self.held = now
+
+    def resume(self, now):
+        with self.lock:
+            if self.held is not None and self.deadline is not None:
+                self.deadline += now - self.held
+            self.held = None
+
+    def check(self, now):
+        """
+        True if the worker is overdue, after which the watchdog is rearmed
+        for another <timeout> seconds so that a replacement worker gets
+        the same grace period.
+        """
+        with self.lock:
+            if self.deadline is None or self.held is not None or \
+               now <= self.deadline:
+                return False
+            if self.stalled_since is None:
+                self.stalled_since = self.deadline - self.timeout
+                self.stalls += 1
+            self.deadline = now + self.timeout
+            self.restarts += 1
+            return True
+
+    def stalled(self, now):
+        """
+        Duration of the ongoing stall in seconds, 0 if there is none.
+        """
+        with self.lock:
+            return 0.0 if self.stalled_since is None else now - self.stalled_since
+
+    def metrics(self, now):
+        with self.lock:
+            current = 0.0 if self.stalled_since is None else now - self.stalled_since
+            return {"stalls":self.stalls, "restarts":self.restarts,
+                    "stalled":round(current, 1),
+                    "longest_stall":round(max(self.longest_stall, current), 1),
+                    "total_stall":round(self.total_stall + current, 1)}